@@ -2,9 +2,10 @@ import numpy as np
 import torch
 
 from helpers.logger import Logger
+from helpers.validity_cache import ValidityCache
+from helpers.eval_index import EvalIndex, sample_files as list_samples
 import helpers.evaluation as ev
 import argparse
-import glob
 import os
 
 from matplotlib import pyplot as plt
@@ -17,25 +18,39 @@ if __name__ == '__main__':
     parser.add_argument('-r', '--run', type=str, help='the run id, a datetime')
     parser.add_argument('-d', '--dataset', type=str, help='the data set to use. possible values: mnist, mazes', choices=['mnist', 'mazes'])
     parser.add_argument('-a', '--action', type=str, help='what to do. possible values: check, draw', choices=['draw','check_ind','check_avg', "check_and_draw"])
+    parser.add_argument('-c', '--cache', type=str, default=None,
+                        help='file to persist the maze validity cache to between evaluations. mazes are only cached '
+                             'when it is given')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='number of processes to check sample files with')
+    parser.add_argument('--reindex', action='store_true',
+                        help='check all sample files again instead of reusing the results of earlier evaluations')
+    parser.add_argument('--cache_size', type=int, default=1000000, help='maximum number of mazes in the cache')
     opt = parser.parse_args()
 
     module_path = os.path.abspath(os.path.join('models', opt.model))
-    samples_path = os.path.abspath(os.path.join('models', opt.model, 'samples', opt.run, '*.sample.tar'))
-    sample_files = glob.glob(samples_path)
-    sample_files.sort()
+    samples_path = os.path.abspath(os.path.join('models', opt.model, 'samples', opt.run))
+    sample_files = list_samples(samples_path)
 
     if opt.action == 'draw':
         logger = Logger(module_path, opt.run, opt)
         ev.draw(sample_files, logger)
+    if opt.cache is not None:
+        ev.CACHE = ValidityCache(opt.cache_size, opt.cache)
     if opt.dataset != 'mazes':
         print("Invalid dataset")
     else:
         if len(sample_files) > 0:
-            if opt.action == 'check_ind':
-               _ = ev.check_ind(sample_files)
-            if opt.action == 'check_avg':
-                ev.check_avg(sample_files)
+            if opt.action in ('check_ind', 'check_avg'):
+                index = EvalIndex(samples_path, opt.reindex)
+                if opt.action == 'check_ind':
+                    _ = ev.check_ind(sample_files, opt.workers, index)
+                if opt.action == 'check_avg':
+                    ev.check_avg(sample_files, opt.workers, index)
+                index.save()
             if opt.action == 'check_and_draw':
                 ev.check_and_draw(sample_files)
+            if ev.CACHE is not None and ev.CACHE.hits + ev.CACHE.misses > 0:
+                print(ev.CACHE.stats())
+                ev.CACHE.save()
         else:
             print("No sample files")
\ No newline at end of file
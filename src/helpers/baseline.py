@@ -5,18 +5,19 @@ Calculating the baseline for a fixed baseline against percentage of correct maze
 import os
 import csv
 import numpy as np
-from maze_utils import check_maze, draw_maze
+try:
+    from helpers import maze_utils
+except ImportError:  # run as a script, e.g. python baseline.py from src/helpers
+    import maze_utils
 
-def random_maze(mx, my, q):
+def random_maze(mx, my, q, chunk=10000):
     count = 0.0
     all_counts = 0.0
     while all_counts < 1000000:
-        all_counts+=1
         # p = [pbt(0) = q, pbt(1) = 1-q]
-        rand_maze = np.random.choice([0, 1], size=(mx, my), p=[q, 1-q])
-        if check_maze(rand_maze):
-            # print(rand_maze)
-            count+=1
+        rand_mazes = np.random.choice([0, 1], size=(chunk, mx, my), p=[q, 1-q])
+        count += int(maze_utils.check_mazes(rand_mazes).sum())
+        all_counts += chunk
     return count, all_counts
 
 if __name__ == "__main__":
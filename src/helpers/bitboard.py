@@ -0,0 +1,263 @@
+"""
+BITBOARD MAZES
+Mazes of up to 8 x 8 pixels fit in a single 64 bit integer, with bit i * size + j set when pixel (i, j) is a hallway.
+All rules of `maze_utils.check_maze` can then be evaluated with shifts and masks, on python ints or on whole numpy
+arrays of boards at once. For mazes of up to 5 x 5 pixels every valid board is kept in a lookup table, which ships in
+helpers/tables and is rebuilt with:
+
+    python -m helpers.bitboard
+"""
+from collections import namedtuple
+from typing import Union
+import numpy as np
+import argparse
+import os
+
+TABLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tables')
+MAX_SIZE = 8
+LUT_MAX_SIZE = 5
+
+Masks = namedtuple('Masks', ['full', 'not_first_col', 'not_last_col', 'border', 'one', 'size', 'diagonal'])
+
+_masks = {}
+_lookup_tables = {}
+
+
+def fits(size: int) -> bool:
+    """Whether a size x size maze fits in a bitboard."""
+    return 0 < size <= MAX_SIZE
+
+
+def to_bitboard(maze: np.ndarray) -> int:
+    """Encode a single square maze as a bitboard.
+
+    Args:
+        maze: An array of size maze_size x maze_size. Pixels equal to 1 are hallways.
+
+    Returns:
+        The bitboard as a python int.
+    """
+    return int(to_bitboards(np.asarray(maze)[None])[0])
+
+
+def to_bitboards(mazes: np.ndarray) -> np.ndarray:
+    """Encode a batch of square mazes as bitboards.
+
+    Args:
+        mazes: An array of size n x maze_size x maze_size. Pixels equal to 1 are hallways.
+
+    Returns:
+        An array of n np.uint64 bitboards.
+    """
+    n = mazes.shape[0]
+    bits = (np.asarray(mazes) == 1).reshape(n, -1).astype(np.uint64)
+    weights = np.left_shift(np.uint64(1), np.arange(bits.shape[1], dtype=np.uint64))
+    return np.bitwise_or.reduce(bits * weights, axis=1) if bits.shape[1] > 0 else np.zeros(n, dtype=np.uint64)
+
+
+def from_bitboard(board: int, size: int) -> np.ndarray:
+    """Decode a single bitboard into a maze.
+
+    Args:
+        board: The bitboard.
+        size: The length and height of the maze.
+
+    Returns:
+        An np.int32 array of size maze_size x maze_size.
+    """
+    return from_bitboards(np.array([board], dtype=np.uint64), size)[0]
+
+
+def from_bitboards(boards: np.ndarray, size: int) -> np.ndarray:
+    """Decode a batch of bitboards into mazes.
+
+    Args:
+        boards: An array of n bitboards.
+        size: The length and height of the mazes.
+
+    Returns:
+        An np.int32 array of size n x maze_size x maze_size.
+    """
+    shifts = np.arange(size * size, dtype=np.uint64)
+    bits = np.right_shift(np.asarray(boards, dtype=np.uint64)[:, None], shifts) & np.uint64(1)
+    return bits.astype(np.int32).reshape(-1, size, size)
+
+
+def _get_masks(size: int, scalar: bool) -> Masks:
+    """Build (and remember) the masks for a board size, either as python ints or as np.uint64 scalars."""
+    key = (size, scalar)
+    if key not in _masks:
+        cast = int if scalar else np.uint64
+        full = not_first_col = not_last_col = border = 0
+        for i in range(size):
+            for j in range(size):
+                bit = 1 << (i * size + j)
+                full |= bit
+                if j > 0:
+                    not_first_col |= bit
+                if j < size - 1:
+                    not_last_col |= bit
+                if i in (0, size - 1) or j in (0, size - 1):
+                    border |= bit
+        _masks[key] = Masks(cast(full), cast(not_first_col), cast(not_last_col), cast(border), cast(1), cast(size),
+                            cast(size + 1))
+    return _masks[key]
+
+
+def _west(board, m: Masks):
+    """Bit c is set when the pixel left of c is set."""
+    return (board << m.one) & m.not_first_col
+
+
+def _east(board, m: Masks):
+    """Bit c is set when the pixel right of c is set."""
+    return (board >> m.one) & m.not_last_col
+
+
+def _north(board, m: Masks):
+    """Bit c is set when the pixel above c is set."""
+    return (board << m.size) & m.full
+
+
+def _south(board, m: Masks):
+    """Bit c is set when the pixel below c is set."""
+    return board >> m.size
+
+
+def _flood(seed, mask, m: Masks, diagonal: bool):
+    """Grow seed inside of mask until it stops changing, with 4-connectivity or 8-connectivity."""
+    reached = seed & mask
+    while True:
+        grown = reached | _west(reached, m) | _east(reached, m)
+        if diagonal:
+            grown = grown | _north(grown, m) | _south(grown, m)
+        else:
+            grown = grown | _north(reached, m) | _south(reached, m)
+        grown = grown & mask
+        if np.array_equal(grown, reached):
+            return reached
+        reached = grown
+
+
+def _check(boards, m: Masks):
+    """Evaluate all rules of `maze_utils.check_maze` on a python int or on an np.uint64 array of boards."""
+    walls = boards ^ m.full
+
+    # no wall pixel with a single white neighbour
+    a, b, c, d = _west(boards, m), _east(boards, m), _north(boards, m), _south(boards, m)
+    any_neighbour = a | b | c | d
+    two_neighbours = (a & b) | (c & d) | ((a | b) & (c | d))
+    dead_ends = walls & any_neighbour & ~two_neighbours
+
+    # no loops
+    blocks = boards & _east(boards, m) & _south(boards, m) & ((boards >> m.diagonal) & m.not_last_col)
+
+    # single connected-component, grown from the lowest hallway pixel
+    lowest = boards & (~boards + m.one)
+    connected = _flood(lowest, boards, m, False) == boards
+
+    # no walls enclosed by hallways, i.e. all walls are reachable from the border
+    open_walls = _flood(m.border, walls, m, True) == walls
+
+    return (boards != 0) & (dead_ends == 0) & (blocks == 0) & connected & open_walls
+
+
+def table_path(size: int) -> str:
+    """The path of the lookup table of a size."""
+    return os.path.join(TABLES, 'valid.{}x{}.lut.npy'.format(size, size))
+
+
+def lookup_table(size: int) -> Union[np.ndarray, None]:
+    """Load the sorted array of all valid bitboards of a size. Tables are never built here, as that takes about a
+    minute for 5 x 5 mazes, see `build_lookup_table`.
+
+    Args:
+        size: The length and height of the mazes. At most LUT_MAX_SIZE.
+
+    Returns:
+        A sorted np.uint64 array of every valid bitboard, or None if the table has not been built.
+    """
+    if size > LUT_MAX_SIZE:
+        raise ValueError('Lookup tables exist only up to {0}x{0} mazes'.format(LUT_MAX_SIZE))
+    if size not in _lookup_tables:
+        path = table_path(size)
+        if not os.path.exists(path):
+            return None
+        _lookup_tables[size] = np.load(path)
+    return _lookup_tables[size]
+
+
+def build_lookup_table(size: int) -> np.ndarray:
+    """Check every bitboard of a size and persist the valid ones as its lookup table. The table is replaced at once,
+    so processes loading it at the same time never see a half written file.
+
+    Args:
+        size: The length and height of the mazes. At most LUT_MAX_SIZE.
+
+    Returns:
+        A sorted np.uint64 array of every valid bitboard.
+    """
+    if size > LUT_MAX_SIZE:
+        raise ValueError('Lookup tables exist only up to {0}x{0} mazes'.format(LUT_MAX_SIZE))
+    m = _get_masks(size, False)
+    chunk = 1 << 20
+    valid = []
+    for start in range(0, 1 << (size * size), chunk):
+        boards = np.arange(start, min(start + chunk, 1 << (size * size)), dtype=np.uint64)
+        valid.append(boards[_check(boards, m)])
+    table = np.concatenate(valid)
+
+    path = table_path(size)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp_path, 'wb') as file:
+        np.save(file, table)
+    os.replace(temp_path, path)
+    _lookup_tables[size] = table
+    return table
+
+
+def check_bitboard(board: int, size: int) -> bool:
+    """Checks whether a bitboard is a valid maze, with the same rules as `maze_utils.check_maze`.
+
+    Args:
+        board: The bitboard.
+        size: The length and height of the maze.
+
+    Returns:
+        Whether the maze is valid or not.
+    """
+    if size <= LUT_MAX_SIZE:
+        return bool(check_bitboards(np.array([board], dtype=np.uint64), size)[0])
+    return bool(_check(int(board), _get_masks(size, True)))
+
+
+def check_bitboards(boards: Union[np.ndarray, list], size: int) -> np.ndarray:
+    """Checks a batch of bitboards at once, with the same rules as `maze_utils.check_maze`.
+
+    Args:
+        boards: An array of n bitboards.
+        size: The length and height of the mazes.
+
+    Returns:
+        A boolean array of size n saying which mazes are valid.
+    """
+    boards = np.asarray(boards, dtype=np.uint64)
+    table = lookup_table(size) if size <= LUT_MAX_SIZE else None
+    if table is not None:
+        if len(table) == 0:
+            return np.zeros(boards.shape, dtype=bool)
+        index = np.minimum(np.searchsorted(table, boards), len(table) - 1)
+        return table[index] == boards
+    return np.asarray(_check(boards, _get_masks(size, False)), dtype=bool)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--size', type=int, default=None,
+                        help='the size of the mazes to build the lookup table of. defaults to all sizes')
+    opts = parser.parse_args()
+
+    for table_size in [opts.size] if opts.size is not None else range(1, LUT_MAX_SIZE + 1):
+        print('Built the {0}x{0} lookup table with {1} valid mazes'.format(table_size,
+                                                                           len(build_lookup_table(table_size))))
@@ -1,14 +1,20 @@
 import os
+import multiprocessing
 from argparse import Namespace
-from typing import Union, Dict, Any
+from queue import Queue, Full
+from threading import Thread, Event
+from typing import Union, Dict, Any, Iterator
 
+import numpy as np
 import torch
+from helpers import maze_shards, maze_utils, packing
 from torchvision import datasets
 from torchvision.transforms import transforms
 
 ROOT = os.path.abspath(os.path.join(os.getcwd(), '..'))
 CUDA = True if torch.cuda.is_available() else False
 TENSOR = torch.cuda.FloatTensor if CUDA else torch.FloatTensor
+JOIN_TIMEOUT = 1.0  # seconds to wait for a prefetch thread that was told to stop
 
 
 def load(args: Namespace, opts: Dict[str, Any]):
@@ -19,18 +25,35 @@ def load(args: Namespace, opts: Dict[str, Any]):
         opts: Additional model-specific options. Useful only for MNIST to specify, resize, binarization, etc.
 
     Returns:
-        The dataset as a Tensor fully loaded into memory, shaped according to batch size and maze size..
+        An iterable over the batches of the dataset, with a length of the number of batches per epoch. Iterables that
+        hold processes or threads have a close() method, which the trainer calls once training ends.
     """
     if args.dataset == 'mnist':
-        return _mnist(args, **opts)
+        batches = _mnist(args, **opts)
     elif args.dataset == 'mazes':
-        return _mazes(args)
+        batches = _mazes(args)
+    elif args.dataset == 'mazes_stream':
+        batches = _maze_stream(args)
     else:
         raise ValueError('Unknown dataset {}'.format(args.dataset))
 
+    if args.prefetch > 0:
+        return Prefetcher(batches, args.prefetch)
+    return batches
 
-def _mnist(args: Namespace, binary: bool, crop: Union[None, int] = None) -> torch.Tensor:
-    """Load the MNIST dataset.
+
+def _to_tensor(array: np.ndarray) -> torch.Tensor:
+    """Convert a batch to TENSOR. On the GPU the batch is copied from pinned memory, so the copy does not hold up the
+    thread that makes it."""
+    batch = torch.from_numpy(array).type(torch.FloatTensor)
+    if CUDA:
+        return batch.pin_memory().cuda(non_blocking=True)
+    return batch
+
+
+def _mnist(args: Namespace, binary: bool, crop: Union[None, int] = None) -> 'Batches':
+    """Load the MNIST dataset. The transformed images are cached in {root}/data/mnist, so that only the first run with
+    the same options has to transform them.
 
     Args:
         args: The CLI arguments.
@@ -38,9 +61,30 @@ def _mnist(args: Namespace, binary: bool, crop: Union[None, int] = None) -> torc
         crop: The size of the image after a center crop. If None, will not crop the image.
 
     Returns:
-        The MNIST dataset as a Tensor fully loaded into memory, shaped according to batch size and maze size..
+        The batches of the MNIST dataset, fully loaded into memory.
     """
     os.makedirs(os.path.join(ROOT, 'data', 'mnist'), exist_ok=True)
+    cache_path = os.path.join(ROOT, 'data', 'mnist', 'train.{}x{}.{}.{}.tar'.format(
+        args.img_size, args.img_size, 'binary' if binary else 'normalized',
+        'uncropped' if crop is None else 'crop{}'.format(crop)))
+    if os.path.exists(cache_path):
+        mnist_loader = torch.load(cache_path)
+    else:
+        mnist_loader = _transform_mnist(args, binary, crop)
+        temp_path = cache_path + '.tmp'
+        torch.save(mnist_loader, temp_path)
+        os.replace(temp_path, cache_path)
+
+    return Batches(mnist_loader.reshape(-1, 1, args.img_size, args.img_size).type(TENSOR), args.batch_size,
+                   not args.no_shuffle, args.last_batch)
+
+
+def _transform_mnist(args: Namespace, binary: bool, crop: Union[None, int]) -> torch.Tensor:
+    """Push every MNIST training image through the torchvision transforms.
+
+    Returns:
+        A Tensor of size 60000 x img_size x img_size.
+    """
     transform = []
 
     if crop is not None:
@@ -56,24 +100,280 @@ def _mnist(args: Namespace, binary: bool, crop: Union[None, int] = None) -> torc
 
     data = datasets.MNIST(os.path.join(ROOT, 'data', 'mnist'), train=True, download=True,
                           transform=transforms.Compose(transform))
-    mnist_loader = torch.zeros(data.train_data.size(0), args.img_size, args.img_size).type(TENSOR)
+    mnist_loader = torch.zeros(data.train_data.size(0), args.img_size, args.img_size)
 
     for idx in range(len(data)):
         mnist_loader[idx], _ = data[idx]
 
-    return mnist_loader.reshape(-1, args.batch_size, 1, args.img_size, args.img_size).type(TENSOR)
+    return mnist_loader
 
 
-def _mazes(args: Namespace) -> torch.Tensor:
-    """Load the MAZE dataset.
+def _mazes(args: Namespace) -> Union['Batches', 'ShardedMazes']:
+    """Load the MAZE dataset, from bits if a packed data set exists. Sharded data sets are streamed from disk instead.
 
     Args:
         args: The CLI arguments.
 
     Returns:
-        The MAZE dataset as a Tensor fully loaded into memory, shaped according to batch size and maze size.
+        The batches of the MAZE dataset, fully loaded into memory unless the data set is streamed or memory mapped.
     """
+    shards = maze_shards.shards_path(args.n_examples, args.maze_size, args.maze_size)
+    if os.path.exists(os.path.join(shards, maze_shards.MANIFEST)):
+        return ShardedMazes(shards, args.batch_size)
+
     data_path = os.path.join(ROOT, 'data', 'mazes',
                              '{}.{}x{}.data.tar'.format(args.n_examples, args.maze_size, args.maze_size))
+    packed_path = os.path.join(ROOT, 'data', 'mazes', '{}.{}x{}.data{}'.format(
+        args.n_examples, args.maze_size, args.maze_size, packing.SUFFIX))
+    if args.mmap:
+        if not os.path.exists(packed_path):
+            _pack_data(data_path, packed_path)
+        return MappedMazes(packed_path, args.batch_size, args.maze_size, not args.no_shuffle, args.last_batch)
+    if os.path.exists(packed_path):
+        mazes = torch.from_numpy(packing.load_packed(packed_path))
+    else:
+        mazes = torch.load(data_path)
+
+    return Batches(mazes.type(TENSOR).reshape(-1, 1, args.maze_size, args.maze_size), args.batch_size,
+                   not args.no_shuffle, args.last_batch)
+
+
+def _maze_stream(args: Namespace) -> 'MazeStream':
+    """Generate fresh MAZE data while training instead of loading a data set. An epoch is as long as an epoch over a
+    data set of n_examples mazes would be.
+
+    Args:
+        args: The CLI arguments.
+
+    Returns:
+        The endless stream of batches of the MAZE dataset.
+    """
+    holdout = None
+    if args.holdout is not None:
+        if args.holdout.endswith(packing.SUFFIX):
+            mazes = packing.load_packed(args.holdout)
+        else:
+            mazes = torch.load(args.holdout).numpy()
+        holdout = set(maze_utils.maze_keys(mazes))
+    return MazeStream(args.batch_size, args.maze_size, args.n_examples // args.batch_size, args.stream_workers,
+                      holdout)
+
+
+class Batches:
+    def __init__(self, data: Union[torch.Tensor, np.ndarray], batch_size: int, shuffle: bool = True,
+                 last_batch: str = 'drop') -> None:
+        """Iterate over the batches of a data set, in a new random order every epoch. Only the order of the indices is
+        shuffled, the data set itself is never copied.
+
+        Args:
+            data: The data set, indexed by example along the first dimension.
+            batch_size: The number of examples per batch.
+            shuffle: Whether to shuffle the examples every epoch.
+            last_batch: What to do with the examples that do not fill a last batch. 'drop' leaves them out, 'pad'
+                fills the last batch up with examples from the start of the epoch.
+        """
+        if last_batch not in ('drop', 'pad'):
+            raise ValueError('Unknown last batch mode {}'.format(last_batch))
+        self.data = data
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.last_batch = last_batch
+
+    def __len__(self) -> int:
+        if self.last_batch == 'pad':
+            return -(-len(self.data) // self.batch_size)
+        return len(self.data) // self.batch_size
+
+    def __iter__(self) -> Iterator[torch.Tensor]:
+        order = torch.randperm(len(self.data)).numpy() if self.shuffle else np.arange(len(self.data))
+        # repeats the order from its start to pad the last batch
+        order = np.resize(order, len(self) * self.batch_size)
+        for start in range(0, len(order), self.batch_size):
+            yield self._batch(order[start:start + self.batch_size])
+
+    def _batch(self, index: np.ndarray) -> torch.Tensor:
+        return self.data[torch.from_numpy(index)]
+
+
+class ShardedMazes:
+    def __init__(self, path: str, batch_size: int) -> None:
+        """Stream batches from a sharded MAZE data set, holding only one shard in memory at a time.
+
+        Args:
+            path: The folder of the data set.
+            batch_size: The number of mazes per batch. Mazes that do not fill a last batch are left out.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.manifest = maze_shards.load_manifest(path)
+        if not self.manifest['complete']:
+            raise ValueError('The data set in {} is incomplete, finish generating it first'.format(path))
+
+    def __len__(self) -> int:
+        return self.manifest['n'] // self.batch_size
+
+    def __iter__(self) -> Iterator[torch.Tensor]:
+        shape = (self.batch_size, 1, self.manifest['my'], self.manifest['mx'])
+        left = np.zeros((0, self.manifest['my'], self.manifest['mx']), dtype=np.uint8)
+        for shard in maze_shards.read_shards(self.path):
+            mazes = np.concatenate((left, shard), axis=0)
+            full = len(mazes) - len(mazes) % self.batch_size
+            for start in range(0, full, self.batch_size):
+                yield _to_tensor(mazes[start:start + self.batch_size]).reshape(shape)
+            left = mazes[full:]
+
+
+def _pack_data(data_path: str, packed_path: str) -> None:
+    """Convert a MAZE data set persisted with torch.save to packed bits once, so that it can be memory mapped. The
+    file is replaced at once, so other processes never map a half written file."""
+    print('Packing {} into {}'.format(data_path, packed_path))
+    temp_path = packed_path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        np.save(file, packing.pack_mazes(torch.load(data_path).numpy()))
+    os.replace(temp_path, packed_path)
+
+
+class MappedMazes(Batches):
+    def __init__(self, path: str, batch_size: int, width: int, shuffle: bool = True, last_batch: str = 'drop') -> None:
+        """Read batches from a packed MAZE data set that is memory mapped instead of loaded. Training processes that
+        use the same data set share its pages in the page cache, and only the current batch is unpacked into floats.
+
+        Args:
+            path: The packed data set, see `packing.save_packed`.
+            batch_size: The number of mazes per batch.
+            width: The length of the mazes.
+            shuffle: Whether to shuffle the mazes every epoch.
+            last_batch: What to do with the mazes that do not fill a last batch, see `Batches`.
+        """
+        super().__init__(np.load(path, mmap_mode='r'), batch_size, shuffle, last_batch)
+        self.width = width
+
+    def _batch(self, index: np.ndarray) -> torch.Tensor:
+        mazes = packing.unpack_mazes(self.data[index], self.width)
+        return _to_tensor(mazes).reshape(-1, 1, self.data.shape[1], self.width)
+
+
+class Prefetcher:
+    def __init__(self, batches, size: int) -> None:
+        """Prepare the next batches of a data set on a background thread, while the model trains on the current one.
+
+        Args:
+            batches: The iterable over the batches of the data set.
+            size: The number of batches to prepare ahead.
+        """
+        self.batches = batches
+        self.size = size
+
+    def __len__(self) -> int:
+        return len(self.batches)
+
+    def close(self) -> None:
+        if hasattr(self.batches, 'close'):
+            self.batches.close()
+
+    def __iter__(self) -> Iterator[torch.Tensor]:
+        queue = Queue(maxsize=self.size)
+        stop = Event()
+        thread = Thread(target=self._fill, args=(queue, stop), daemon=True)
+        thread.start()
+        try:
+            while True:
+                done, item = queue.get()
+                if done:
+                    if item is not None:
+                        raise item
+                    return
+                yield item
+        finally:
+            # also stops the thread when the training loop leaves an epoch early. The thread may be stuck waiting for
+            # its next batch, e.g. from a maze stream, so it is only waited for briefly; as a daemon it cannot block exit
+            stop.set()
+            thread.join(timeout=JOIN_TIMEOUT)
+
+    def _fill(self, queue: Queue, stop: Event) -> None:
+        """Put (done, batch) pairs in the queue, ending with (True, None) or (True, error)."""
+        try:
+            for batch in self.batches:
+                if not self._put(queue, stop, (False, batch)):
+                    return
+            self._put(queue, stop, (True, None))
+        except Exception as error:
+            self._put(queue, stop, (True, error))
+
+    @staticmethod
+    def _put(queue: Queue, stop: Event, item: tuple) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+
+class MazeStream:
+    def __init__(self, batch_size: int, size: int, n_batches: int, workers: int = 1, holdout: set = None,
+                 seed: int = None) -> None:
+        """Stream batches of newly generated mazes. Worker processes keep generating mazes into a bounded queue, so
+        that training never waits on generation as long as there are enough workers.
+
+        Args:
+            batch_size: The number of mazes per batch.
+            size: The length and height of the mazes.
+            n_batches: The number of batches per epoch.
+            workers: The number of processes to generate the mazes with.
+            holdout: Keys of mazes, see `maze_utils.maze_keys`, that should never be streamed.
+            seed: The seed of the random state the worker seeds are drawn from.
+        """
+        self.batch_size = batch_size
+        self.size = size
+        self.n_batches = n_batches
+        self.workers = workers
+        self.holdout = holdout
+        self.seed = seed
+        self.queue = None
+        self.processes = []
+
+    def __len__(self) -> int:
+        return self.n_batches
+
+    def __iter__(self) -> Iterator[torch.Tensor]:
+        if self.queue is None:
+            self._start()
+        shape = (self.batch_size, 1, self.size, self.size)
+        for _ in range(self.n_batches):
+            yield _to_tensor(self.queue.get()).reshape(shape)
+
+    def _start(self) -> None:
+        """Start the workers, which keep running over all epochs until `close` is called."""
+        self.queue = multiprocessing.Queue(maxsize=2 * self.workers)
+        seeds = np.random.RandomState(self.seed).randint(2 ** 31, size=self.workers)
+        for seed in seeds:
+            process = multiprocessing.Process(target=_stream_mazes, daemon=True, args=(
+                self.queue, self.batch_size, self.size, self.holdout, None if self.seed is None else seed))
+            process.start()
+            self.processes.append(process)
+
+    def close(self) -> None:
+        """Stop the workers. Iterating again starts new ones."""
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        self.queue = None
+
 
-    return torch.load(data_path).type(TENSOR).reshape(-1, args.batch_size, 1, args.maze_size, args.maze_size)
+def _stream_mazes(queue: multiprocessing.Queue, batch_size: int, size: int, holdout: Union[None, set],
+                  seed: Union[None, int]) -> None:
+    """Put batches of new mazes in the queue forever, leaving out the mazes in holdout."""
+    rng = np.random.RandomState(seed)
+    left = np.zeros((0, size, size), dtype=np.uint8)
+    while True:
+        mazes = maze_utils.gen_mazes(batch_size, size, size, rng).astype(np.uint8)
+        if holdout is not None:
+            mazes = mazes[[key not in holdout for key in maze_utils.maze_keys(mazes)]]
+        left = np.concatenate((left, mazes), axis=0)
+        while len(left) >= batch_size:
+            queue.put(left[:batch_size])
+            left = left[batch_size:]
@@ -0,0 +1,99 @@
+from typing import Union, Tuple, List
+from helpers import packing, sample_store
+import glob
+import csv
+import os
+
+INDEX_FILE = 'evaluation.csv'
+
+
+def sample_files(sample_path: str) -> List[str]:
+    """List the sample files of a run in the order they were generated, followed by the samples in its sample store.
+
+    Args:
+        sample_path: The samples folder of a run, i.e. {module}/samples/{run}.
+
+    Returns:
+        The sorted paths to the sample files and the paths that refer to the samples in the store.
+    """
+    files = glob.glob(os.path.join(sample_path, '*.sample.tar'))
+    files += glob.glob(os.path.join(sample_path, '*.sample' + packing.SUFFIX))
+    files.sort()
+    return files + sample_store.SampleStore(sample_path).paths()
+
+
+def sample_step(file: str) -> int:
+    """The global step a sample file or a sample in a store was generated at."""
+    return int(os.path.basename(file).split('.')[0].split('_')[1])
+
+
+def _stamp(file: str) -> Tuple[int, int]:
+    """The size and modification time of a sample file. Samples in a store never change once they are appended, so
+    their offset in the store stands in for the modification time."""
+    if sample_store.is_entry(file):
+        _, entry = sample_store.find_entry(file)
+        return entry.count * entry.size * ((entry.size + 7) // 8), entry.offset
+    stat = os.stat(file)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _key(file: str) -> str:
+    """The name of a sample file, or of a sample in a store, in the index."""
+    if sample_store.is_entry(file):
+        return os.path.join(sample_store.STORE_FILE, os.path.basename(file))
+    return os.path.basename(file)
+
+
+class EvalIndex:
+    def __init__(self, sample_path: str, reset: bool = False) -> None:
+        """Remember the number of valid mazes of every sample file of a run in a csv file next to the samples, so that
+        evaluating the run again only checks files that are new or have changed since.
+
+        Args:
+            sample_path: The samples folder of a run, i.e. {module}/samples/{run}.
+            reset: Whether to ignore the results that were stored before.
+        """
+        self.path = os.path.join(sample_path, INDEX_FILE)
+        self.entries = {}
+        if not reset and os.path.exists(self.path):
+            with open(self.path, newline='') as file:
+                for row in csv.DictReader(file):
+                    self.entries[row['file']] = (int(row['size']), int(row['mtime_ns']),
+                                                 int(row['correct']), int(row['total']))
+
+    def lookup(self, file: str) -> Union[None, Tuple[int, int]]:
+        """Get the stored results of a sample file, if the file did not change since they were stored.
+
+        Args:
+            file: The path to the sample file.
+
+        Returns:
+            The number of valid mazes and the number of mazes in the file, or None if the file has to be checked.
+        """
+        entry = self.entries.get(_key(file))
+        if entry is None:
+            return None
+        if _stamp(file) != entry[:2]:
+            return None
+        return entry[2], entry[3]
+
+    def update(self, file: str, correct: int, total: int) -> None:
+        """Store the results of a sample file.
+
+        Args:
+            file: The path to the sample file.
+            correct: The number of valid mazes in the file.
+            total: The number of mazes in the file.
+        """
+        self.entries[_key(file)] = (*_stamp(file), correct, total)
+
+    def save(self) -> None:
+        """Persist the index next to the samples. The file is replaced at once, so an interrupted save does not lose
+        earlier results."""
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', newline='') as file:
+            writer = csv.writer(file, delimiter=',')
+            writer.writerow(['file', 'size', 'mtime_ns', 'correct', 'total'])
+            for name in sorted(self.entries):
+                writer.writerow([name, *self.entries[name]])
+        os.replace(temp_path, self.path)
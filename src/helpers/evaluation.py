@@ -1,44 +1,137 @@
-from typing import List
+from typing import List, Tuple, Iterator
 
 from helpers import maze_utils as mu
-from helpers import misc
+from helpers import misc, packing, sample_store
+import multiprocessing
+import numpy as np
 import torch
 
+from helpers.eval_index import EvalIndex, sample_step
 from helpers.logger import Logger
 
+# Optional helpers.validity_cache.ValidityCache used for all checks, set by eval.py
+CACHE = None
+
+
+def check(sample) -> np.ndarray:
+    """Check a batch of mazes, through the validity cache if one is set."""
+    if CACHE is not None:
+        return CACHE.check(sample)
+    return mu.check_mazes(sample)
+
+
+def load_sample(file: str) -> np.ndarray:
+    """Load a sample file, either a torch tensor or bit-packed mazes, or a sample in a store.
+
+    Args:
+        file: The path to a sample file or to a sample in a store, see `eval_index.sample_files`.
+
+    Returns:
+        The sample as an array of size n x maze_length x maze_height.
+    """
+    if sample_store.is_entry(file):
+        return sample_store.read_entry(file)
+    if file.endswith(packing.SUFFIX):
+        return packing.load_packed(file)
+    return torch.load(file, map_location='cpu').numpy()
+
 
 def draw(files: List[str], logger: Logger):
     for file in files:
-        batch = int(file.split('_')[1].split('.')[0])
-        fake_imgs = torch.load(file, map_location='cpu')
+        batch = sample_step(file)
+        fake_imgs = torch.from_numpy(load_sample(file))
         logger.save_image_grid(None, fake_imgs, batch)
 
 
-def check_ind(files) -> [float]:
-    run_stats = []
+def count_correct(file: str) -> Tuple[int, int]:
+    """Load a sample file and count its valid mazes.
+
+    Args:
+        file: The path to a sample file.
+
+    Returns:
+        The number of valid mazes and the number of mazes in the file.
+    """
+    sample = load_sample(file)
+    return int(check(sample).sum()), sample.shape[0]
+
+
+def count_all(files: List[str], workers: int = 1, index: EvalIndex = None) -> Iterator[Tuple[int, int]]:
+    """Count the valid mazes of every sample file, in the order of the files.
+
+    Args:
+        files: The paths to the sample files.
+        workers: The number of processes to spread the files over. Each worker starts with a copy of the cache, and
+            the mazes it checks are added to the cache of the main process.
+        index: An optional index with the results of earlier evaluations. Only files it does not know are checked,
+            and their results are added to it.
+
+    Returns:
+        An iterator over the number of valid mazes and the number of mazes of each file.
+    """
+    known = {file: index.lookup(file) for file in files} if index is not None else {}
+    pending = [file for file in files if known.get(file) is None]
+    results = _count(pending, workers)
     for file in files:
-        correct = 0
-        sample = torch.load(file).numpy()
-        for maze in sample:
-            correct += int(mu.check_maze(maze))
+        counts = known.get(file)
+        if counts is None:
+            counts = next(results)
+            if index is not None:
+                index.update(file, *counts)
+        yield counts
+
+
+def _count_in_worker(file: str) -> Tuple[int, int, dict, int, int]:
+    """Count the valid mazes of a sample file in a pool worker, with the copy of the cache the worker holds.
 
-        file = file.split("/")
-        file = "total_batch_" + str(int(file[len(file) - 1].split(".")[0].split("_")[1]))
+    Returns:
+        The number of valid mazes and the number of mazes in the file, the validity of the mazes that were not in the
+        cache yet by their key, and the number of cache hits and misses.
+    """
+    sample = load_sample(file)
+    hits, misses = CACHE.hits, CACHE.misses
+    new_keys = [key for key in CACHE.keys(sample) if key not in CACHE.entries]
+    checks = CACHE.check(sample)
+    learned = {key: CACHE.entries[key] for key in new_keys if key in CACHE.entries}
+    return int(checks.sum()), sample.shape[0], learned, CACHE.hits - hits, CACHE.misses - misses
+
+
+def _count(files: List[str], workers: int) -> Iterator[Tuple[int, int]]:
+    if workers <= 1:
+        for file in files:
+            yield count_correct(file)
+    elif CACHE is None:
+        with multiprocessing.Pool(workers) as pool:
+            for result in pool.imap(count_correct, files, chunksize=max(1, len(files) // (workers * 16))):
+                yield result
+    else:
+        # the workers send back what they checked, so the cache of the main process can be saved with it
+        with multiprocessing.Pool(workers) as pool:
+            for correct, total, learned, hits, misses in pool.imap(
+                    _count_in_worker, files, chunksize=max(1, len(files) // (workers * 16))):
+                CACHE.update(learned, hits, misses)
+                yield correct, total
+
+
+def check_ind(files, workers: int = 1, index: EvalIndex = None) -> [float]:
+    run_stats = []
+    for file, (correct, total) in zip(files, count_all(files, workers, index)):
+        file = "total_batch_" + str(sample_step(file))
 
-        print(file, correct, '/', sample.shape[0])
+        print(file, correct, '/', total)
         run_stats.append(correct)
     return run_stats
 
 
-def check_avg(files):
+def check_avg(files, workers: int = 1, index: EvalIndex = None):
+    results = count_all(files, workers, index)
     for idx, chunk in enumerate(misc.chunks(files, 100)):
         correct = 0
         total = 0
-        for file in chunk:
-            sample = torch.load(file).numpy()
-            total += sample.shape[0]
-            for maze in sample:
-                correct += int(mu.check_maze(maze))
+        for _ in chunk:
+            file_correct, file_total = next(results)
+            correct += file_correct
+            total += file_total
 
         print(idx, ':', correct, '/', total)
 
@@ -46,11 +139,10 @@ def check_avg(files):
 def check_and_draw(files):
     for file in files:
         correct = 0
-        sample = torch.load(file).numpy()
-        for maze in sample:
-            check = mu.check_maze(maze)
-            correct += int(check)
-            if check:
-                mu.draw(maze)
+        sample = load_sample(file)
+        checks = check(sample)
+        correct += int(checks.sum())
+        for maze in sample[checks]:
+            mu.draw(maze)
         if correct > 0:
             print(file, correct, '/', sample.shape[0])
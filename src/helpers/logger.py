@@ -1,14 +1,65 @@
 from typing import Union
+from queue import Queue, Full
+from threading import Thread
+import multiprocessing
+import functools
+import traceback
 
 from torchvision.utils import save_image
-from helpers import maze_utils
+from helpers import maze_utils, maze_torch, packing
+from helpers.sample_store import SampleStore
 from tensorboardX import SummaryWriter
 from torch.autograd import Variable
+import numpy as np
 import torch
 import os
 import csv
 import json
 
+QUEUE_SIZE = 64
+
+
+def _detached(value):
+    """A copy of a tensor that is cut from the graph, so the training loop is free to change the original."""
+    return value.detach().clone() if isinstance(value, torch.Tensor) else value
+
+
+def deferred(method):
+    """Run a logging method on the writer thread when the logger is asynchronous. The training thread only copies the
+    tensors and queues the call, the writer thread does the formatting, `.item()` calls and I/O."""
+    @functools.wraps(method)
+    def defer(self, *args, **kwargs):
+        if self.queue is None:
+            return method(self, *args, **kwargs)
+        self.queue.put((method, [_detached(arg) for arg in args], {k: _detached(v) for k, v in kwargs.items()}))
+    return defer
+
+
+def render_grid(dataset: str, images: np.ndarray, path: str) -> None:
+    """Save the first 25 images of a batch as a 5 x 5 grid.
+
+    Args:
+        dataset: The data set the images belong to, mnist or mazes.
+        images: An array of size batch_size x 1 x img_size x img_size for mnist, batch_size x maze_size x maze_size for
+            mazes.
+        path: The path to the file where the grid will be persisted.
+    """
+    if dataset == 'mnist':
+        save_image(torch.from_numpy(images[:25]), path, nrow=5, normalize=True)
+    else:
+        maze_utils.save_grid(images[:25], path)
+
+
+def _render_grids(queue: multiprocessing.Queue) -> None:
+    """Render the queued grids until None is queued. A grid that fails is reported and skipped, so it does not stop
+    the rendering of the grids after it."""
+    for dataset, images, path in iter(queue.get, None):
+        try:
+            render_grid(dataset, images, path)
+        except Exception:
+            print('Failed to render the image grid {}:'.format(path))
+            traceback.print_exc()
+
 
 # noinspection PyMethodMayBeStatic
 class Logger:
@@ -18,6 +69,8 @@ class Logger:
         Args:
             module_path: The path to the module that is currently being executed.
             run: An id of the current run. Should match the Tensorboard run id. Usually a datetime.
+            args: The CLI arguments. With args.async_logging, logging calls are handled by a background writer thread.
+                With args.render_process, image grids are rendered by a separate process.
         """
 
         self.run = run
@@ -39,7 +92,36 @@ class Logger:
                                   "epoch": 0}
 
         self.args = args
+        self.store = SampleStore(self.sample_path)
+
+        # the renderer is spawned rather than forked, since the training process may already run threads or CUDA
+        self.renderer = None
+        if getattr(args, 'render_process', False):
+            context = multiprocessing.get_context('spawn')
+            self.render_queue = context.Queue(maxsize=QUEUE_SIZE)
+            self.renderer = context.Process(target=_render_grids, args=(self.render_queue,), daemon=True)
+            self.renderer.start()
 
+        self.queue = None
+        self.errors = []
+        if getattr(args, 'async_logging', False):
+            self.queue = Queue(maxsize=QUEUE_SIZE)
+            self.thread = Thread(target=self._write, daemon=True)
+            self.thread.start()
+
+    def _write(self) -> None:
+        """Handle the queued logging calls until close_writers queues None."""
+        while True:
+            call = self.queue.get()
+            if call is None:
+                return
+            method, args, kwargs = call
+            try:
+                method(self, *args, **kwargs)
+            except Exception as error:
+                self.errors.append(error)
+
+    @deferred
     def log_batch_statistics(self, epoch: int, epochs: int, batch: int, batches: int,
                              d_loss: Variable, g_loss: Variable,
                              real_scores: Variable = None, fake_scores: Variable = None) -> None:
@@ -75,10 +157,12 @@ class Logger:
             self.lastest_GAN_stats["d_loss"] = d_loss.item()
             self.lastest_GAN_stats["epoch"] = epoch + 1
 
+    @deferred
     def save_image_grid(self, real_imgs, fake_imgs, step) -> None:
-        """Save a  5 x 5 grid of images, real and generated. Does not do any up scaling on the images,
-        so small mazes of e.g. 8 x 8 will not show well. Accepts batches of images using
-        PyTorch batch representation batch_size x 1 x *image_dimensions
+        """Save a  5 x 5 grid of images, real and generated. Does not do any up scaling on mnist images, mazes are
+        scaled up by `maze_utils.save_grid`. Accepts batches of images using PyTorch batch representation
+        batch_size x 1 x *image_dimensions. With args.render_process the images are copied to the host and the grids
+        are rendered by a separate process, so the caller only pays for the copy.
 
         Args:
             real_imgs: The training images. A Tensor of size batch_size x 1 x ...
@@ -87,24 +171,35 @@ class Logger:
         """
         real_path = os.path.join(self.image_path, 'real_{0:0=8d}.png').format(step)
         fake_path = os.path.join(self.image_path, 'fake_{0:0=8d}.png').format(step)
-        if self.args.dataset == 'mnist':
-            if real_imgs is not None:
-                size = real_imgs.size()
-                save_image(real_imgs.view(size[0], 1, size[-1], size[-1]).data[:25], real_path, nrow=5,
-                           normalize=True)
-            if fake_imgs is not None:
-                size = fake_imgs.size()
-                save_image(fake_imgs.view(size[0], 1, size[-1], size[-1]).data[:25], fake_path, nrow=5,
-                           normalize=True)
-        elif self.args.dataset == 'mazes':
-            if real_imgs is not None:
-                size = real_imgs.size()
-                maze_utils.save_grid(
-                    real_imgs.view(size[0], size[-1], size[-1]).data.cpu().numpy()[:25], real_path)
-            if fake_imgs is not None:
-                size = fake_imgs.size()
-                maze_utils.save_grid(fake_imgs.view(size[0], size[-1], size[-1]).data.cpu().numpy()[:25], fake_path)
+        for images, path in [(real_imgs, real_path), (fake_imgs, fake_path)]:
+            if images is None:
+                continue
+            size = images.size()
+            if self.args.dataset == 'mnist':
+                images = images.reshape(size[0], 1, size[-1], size[-1])
+            else:
+                images = images.reshape(size[0], size[-1], size[-1])
+            images = images[:25].detach().cpu().numpy().copy()
+            if self.renderer is None:
+                render_grid(self.args.dataset, images, path)
+            elif not self._queue_render((self.args.dataset, images, path)):
+                raise RuntimeError('The image grid renderer stopped with exit code {}'.format(self.renderer.exitcode))
+
+    def _queue_render(self, item) -> bool:
+        """Put an item in the queue of the renderer, waiting for room only while the renderer is running.
 
+        Returns:
+            Whether the item was queued.
+        """
+        while self.renderer.is_alive():
+            try:
+                self.render_queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    @deferred
     def log_tensorboard_basic_data(self, g_loss: Variable, d_loss: Variable, real_scores: Variable = None,
                                    fake_scores: Variable = None, step: int = 0) -> None:
         """ Log basic data to show plots of generator and discriminator losses and the mean scores of the
@@ -124,6 +219,27 @@ class Logger:
         if fake_scores is not None:
             self.writer.add_scalar('D(G(z))', fake_scores.detach().mean().item(), step)
 
+    @deferred
+    def log_tensorboard_maze_validity(self, fake_mazes: Variable, step: int) -> None:
+        """ Log the fraction of valid generated mazes. The check runs on the device of the generator, so only the
+        final fraction is copied to the host.
+
+        Args:
+            fake_mazes: The generated mazes. A Tensor of size batch_size x maze_length x maze_height.
+            step: The current global step.
+        """
+        self.writer.add_scalar('Mazes/valid', maze_torch.valid_fraction(fake_mazes).item(), step)
+
+    @deferred
+    def log_tensorboard_steps_per_sec(self, steps_per_sec: float, step: int) -> None:
+        """ Log the training throughput of an epoch.
+
+        Args:
+            steps_per_sec: The number of batches trained on per second.
+            step: The current global step.
+        """
+        self.writer.add_scalar('Performance/steps_per_sec', steps_per_sec, step)
+
     def log_tensorboard_parameter_data(self, generator: torch.nn.Module,
                                        discriminator: torch.nn.Module, step: int) -> None:
         """ Log advanced parameter and gradient data. Should only be called when debugging for performance reasons.
@@ -149,10 +265,18 @@ class Logger:
             # self.writer.add_histogram("Discriminator/" + name + '/grad', param.grad.detach().data.cpu().numpy(),
             #                      step, bins='auto')
 
+    @deferred
     def log_generated_sample(self, data: Variable, step: int) -> None:
         input_size = data.size(-1)
-        path = os.path.join(self.sample_path, 'fake_{0:0=8d}.sample.tar'.format(step))
-        torch.save(data.detach().cpu().view(-1, input_size, input_size), path)
+        sample = data.detach().cpu().view(-1, input_size, input_size)
+        if getattr(self.args, 'sample_store', False):
+            self.store.append(sample.numpy(), step)
+        elif getattr(self.args, 'pack_samples', False):
+            path = os.path.join(self.sample_path, 'fake_{0:0=8d}.sample{1}'.format(step, packing.SUFFIX))
+            packing.save_packed(sample.numpy(), path)
+        else:
+            path = os.path.join(self.sample_path, 'fake_{0:0=8d}.sample.tar'.format(step))
+            torch.save(sample, path)
 
     def log_hyper_parameters(self, path, hyperparameters):
         exDict = {'hyperparameters': vars(hyperparameters)}
@@ -161,5 +285,20 @@ class Logger:
             file.write(json.dumps(exDict))  # use `json.loads` to do the reverse
 
     def close_writers(self):
+        """Flush the logging calls that are still queued and close the files."""
+        if self.queue is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.queue = None
+        if self.renderer is not None:
+            self._queue_render(None)
+            self.renderer.join()
+            if self.renderer.exitcode != 0:
+                self.errors.append(RuntimeError('The image grid renderer stopped with exit code {}'
+                                                .format(self.renderer.exitcode)))
+            self.renderer = None
         self.writer.close()
         self.csv_file.close()
+        self.store.close()
+        if len(self.errors) > 0:
+            raise self.errors[0]
@@ -0,0 +1,101 @@
+"""
+SHARDED MAZE DATA SETS
+A data set of n mazes is stored in a folder {n}.{s}x{s}.shards holding fixed size bit-packed shards and a manifest.json
+that lists them. Shards are written as soon as they are full, so data sets do not have to fit in memory, and an interrupted
+generation continues after the last shard in the manifest.
+"""
+from typing import Iterator
+from helpers import maze_utils, packing
+import numpy as np
+import json
+import os
+
+ROOT = os.path.abspath(os.path.join(os.getcwd(), '..'))
+MANIFEST = 'manifest.json'
+
+
+def shards_path(n: int, mx: int, my: int) -> str:
+    """The folder of a sharded data set of n mazes of size mx by my."""
+    return os.path.join(ROOT, 'data', 'mazes', '{}.{}x{}.shards'.format(n, mx, my))
+
+
+def load_manifest(path: str) -> dict:
+    with open(os.path.join(path, MANIFEST)) as file:
+        return json.load(file)
+
+
+def _save_manifest(path: str, manifest: dict) -> None:
+    """Replace the manifest at once, so that a crash never leaves a half written manifest behind."""
+    temp_path = os.path.join(path, MANIFEST + '.tmp')
+    with open(temp_path, 'w') as file:
+        file.write(json.dumps(manifest))
+    os.replace(temp_path, os.path.join(path, MANIFEST))
+
+
+def write_shards(n: int, mx: int, my: int, shard_size: int = 100000, workers: int = 1, seed: int = None,
+                 path: str = None) -> str:
+    """Generate n unique mazes of size mx by my into a sharded data set. If the folder already holds part of the same
+    data set, generation resumes after its last complete shard.
+
+    Args:
+        n: The number of mazes to generate.
+        mx: The length of a maze.
+        my: The height of a maze.
+        shard_size: The number of mazes per shard. Only the last shard may be smaller.
+        workers: The number of processes to generate the mazes with.
+        seed: The seed of the random state the generator seeds are drawn from.
+        path: The folder to write to. Defaults to `shards_path`.
+
+    Returns:
+        The folder of the data set.
+    """
+    path = shards_path(n, mx, my) if path is None else path
+    os.makedirs(path, exist_ok=True)
+    manifest = {'n': n, 'mx': mx, 'my': my, 'shard_size': shard_size, 'seed': seed, 'shards': [], 'complete': False}
+    seen = set()
+    if os.path.exists(os.path.join(path, MANIFEST)):
+        previous = load_manifest(path)
+        if any(previous[key] != manifest[key] for key in ['n', 'mx', 'my', 'shard_size', 'seed']):
+            raise ValueError('{} holds a different data set, remove it first'.format(path))
+        manifest = previous
+        for mazes in read_shards(path):
+            seen.update(maze_utils.maze_keys(mazes))
+        print('Resuming after {} shards with {} mazes'.format(len(manifest['shards']), len(seen)))
+    if manifest['complete']:
+        return path
+
+    # every resumed generation draws from a different seed stream, so it does not repeat the mazes already written
+    seeds = np.random.RandomState(None if seed is None else [seed, len(manifest['shards'])])
+    buffer = np.zeros([0, my, mx], dtype=np.uint8)
+    for mazes in maze_utils.unique_mazes(n - len(seen), mx, my, workers, seeds, seen):
+        buffer = np.concatenate((buffer, mazes.astype(np.uint8)), axis=0)
+        while len(buffer) >= shard_size:
+            _write_shard(path, manifest, buffer[:shard_size])
+            buffer = buffer[shard_size:]
+    if len(buffer) > 0:
+        _write_shard(path, manifest, buffer)
+    manifest['complete'] = True
+    _save_manifest(path, manifest)
+    return path
+
+
+def _write_shard(path: str, manifest: dict, mazes: np.ndarray) -> None:
+    """Write a shard and only then add it to the manifest."""
+    name = 'shard_{0:0=6d}{1}'.format(len(manifest['shards']), packing.SUFFIX)
+    packing.save_packed(mazes, os.path.join(path, name))
+    manifest['shards'].append({'file': name, 'count': len(mazes)})
+    _save_manifest(path, manifest)
+
+
+def read_shards(path: str) -> Iterator[np.ndarray]:
+    """Stream the shards of a data set one at a time, in the order they were written.
+
+    Args:
+        path: The folder of the data set.
+
+    Returns:
+        An iterator over arrays of size shard_size x my x mx.
+    """
+    manifest = load_manifest(path)
+    for shard in manifest['shards']:
+        yield packing.load_packed(os.path.join(path, shard['file']), manifest['mx'])
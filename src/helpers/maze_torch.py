@@ -0,0 +1,91 @@
+from torch.nn import functional
+import torch
+
+
+def _flood(seed: torch.Tensor, mask: torch.Tensor, kernel_size: tuple, check_every: int) -> torch.Tensor:
+    """Repeatedly spread the values of seed to their neighbours with a max-pooling, staying inside of mask, until
+    nothing changes anymore.
+
+    Args:
+        seed: The values to spread, a Tensor of size n x 1 x maze_length x maze_height.
+        mask: The pixels the values may spread to, a Tensor of the same size as seed holding 0's and 1's.
+        kernel_size: The neighbourhood of a pixel. (3, 1) and (1, 3) together give 4-connectivity, (3, 3) gives
+            8-connectivity.
+        check_every: How many steps to take between checks for convergence. Each check synchronizes with the device.
+
+    Returns:
+        The spread values.
+    """
+    current = seed * mask
+    while True:
+        previous = current
+        for _ in range(check_every):
+            if kernel_size == (3, 3):
+                spread = functional.max_pool2d(current, 3, stride=1, padding=1)
+            else:
+                spread = torch.max(functional.max_pool2d(current, (3, 1), stride=1, padding=(1, 0)),
+                                   functional.max_pool2d(current, (1, 3), stride=1, padding=(0, 1)))
+            current = spread * mask
+        if torch.equal(current, previous):
+            return current
+
+
+def check_mazes(mazes: torch.Tensor) -> torch.Tensor:
+    """Checks a batch of mazes on the device they live on. Applies the same rules as `maze_utils.check_maze`:
+        * there is at least one white pixel.
+        * no wall pixel has exactly one white neighbour.
+        * all white pixels are connected.
+        * there are no 2 x 2 blocks of white pixels (i.e. there are no loops).
+        * every group of wall pixels touches the border (i.e. there are no islands).
+
+    Args:
+        mazes: A Tensor of size n x maze_length x maze_height or n x 1 x maze_length x maze_height. Pixels above 0.5
+            are hallways, which matches how the models binarize their samples before logging them.
+
+    Returns:
+        A Tensor of size n saying which mazes are valid.
+    """
+    mazes = mazes.detach()
+    n, mx, my = mazes.size(0), mazes.size(-2), mazes.size(-1)
+    hallways = (mazes.view(n, 1, mx, my) > 0.5).float()
+    walls = 1 - hallways
+
+    # at least one white pixel
+    valid = hallways.view(n, -1).max(dim=1)[0] > 0
+
+    # no wall pixel with a single white neighbour
+    cross = hallways.new_tensor([[0, 1, 0], [1, 0, 1], [0, 1, 0]]).view(1, 1, 3, 3)
+    neighbours = functional.conv2d(hallways, cross, padding=1)
+    dead_ends = (walls * (neighbours == 1).float()).view(n, -1).max(dim=1)[0]
+    valid = valid & (dead_ends == 0)
+
+    # no loops
+    if mx > 1 and my > 1:
+        blocks = functional.conv2d(hallways, hallways.new_ones(1, 1, 2, 2))
+        valid = valid & ((blocks == 4).float().view(n, -1).max(dim=1)[0] == 0)
+
+    # single connected-component: every hallway ends up with the highest index of its component
+    index = torch.arange(1, mx * my + 1, device=mazes.device).float().view(1, 1, mx, my)
+    labels = _flood(index.expand(n, 1, mx, my), hallways, (3, 1), max(mx, my)).view(n, -1)
+    lowest = (labels + walls.view(n, -1) * (mx * my + 1)).min(dim=1)[0]
+    valid = valid & (labels.max(dim=1)[0] == lowest)
+
+    # no walls enclosed by hallways: walls reachable from the border through other walls
+    border = torch.ones_like(hallways)
+    border[:, :, 1:-1, 1:-1] = 0
+    reached = _flood(border, walls, (3, 3), max(mx, my))
+    valid = valid & ((walls - reached).view(n, -1).max(dim=1)[0] == 0)
+
+    return valid
+
+
+def valid_fraction(mazes: torch.Tensor) -> torch.Tensor:
+    """The fraction of valid mazes in a batch, computed on the device the mazes live on.
+
+    Args:
+        mazes: A Tensor of size n x maze_length x maze_height or n x 1 x maze_length x maze_height.
+
+    Returns:
+        A Tensor of size 1 with the fraction of valid mazes.
+    """
+    return check_mazes(mazes).float().mean()
@@ -5,15 +5,79 @@
 # FB - 20121214
 # Modified by Peter O'Conor
 
-from mpl_toolkits.axes_grid1 import ImageGrid
 from scipy.ndimage.measurements import label
 from matplotlib import pyplot as plt
+from PIL import Image
+try:
+    from helpers import bitboard
+except ImportError:  # run as a script, e.g. python helpers/maze_utils.py -a generate
+    import bitboard
+from typing import Tuple, Union, Iterator
+import multiprocessing
 import numpy as np
 import argparse
 import torch
 import os
 
 ROOT = os.path.abspath(os.path.join(os.getcwd(), '..'))
+GEN_CHUNK = 10000
+
+
+def connectivity(maze: np.ndarray) -> Tuple[int, bool]:
+    """Find the connected components of a maze with a union-find over its pixels. A single sweep joins every pixel to
+    its already visited neighbours: hallways are joined horizontally and vertically, walls also diagonally.
+
+    Args:
+        maze: The maze to be evaluated. Pixels equal to 1 are hallways.
+
+    Returns:
+        The number of hallway components and whether any group of walls is enclosed by hallways (i.e. does not touch
+        the border).
+    """
+    mx, my = maze.shape
+    hallways = (np.asarray(maze) == 1).ravel().tolist()
+    parent = list(range(mx * my))
+
+    def find(cell: int) -> int:
+        while parent[cell] != cell:
+            parent[cell] = parent[parent[cell]]
+            cell = parent[cell]
+        return cell
+
+    def union(a: int, b: int) -> None:
+        a, b = find(a), find(b)
+        if a != b:
+            parent[a] = b
+
+    for i in range(mx):
+        for j in range(my):
+            cell = i * my + j
+            hallway = hallways[cell]
+            if j > 0 and hallways[cell - 1] == hallway:
+                union(cell, cell - 1)
+            if i > 0:
+                if hallways[cell - my] == hallway:
+                    union(cell, cell - my)
+                if not hallway:
+                    if j > 0 and not hallways[cell - my - 1]:
+                        union(cell, cell - my - 1)
+                    if j < my - 1 and not hallways[cell - my + 1]:
+                        union(cell, cell - my + 1)
+
+    hallway_roots = set()
+    wall_roots = set()
+    border_roots = set()
+    for i in range(mx):
+        for j in range(my):
+            cell = i * my + j
+            root = find(cell)
+            if hallways[cell]:
+                hallway_roots.add(root)
+            elif i == 0 or j == 0 or i == mx - 1 or j == my - 1:
+                border_roots.add(root)
+            else:
+                wall_roots.add(root)
+    return len(hallway_roots), not wall_roots <= border_roots
 
 
 def base_check_maze(maze: np.ndarray) -> bool:
@@ -28,10 +92,9 @@ def base_check_maze(maze: np.ndarray) -> bool:
             Whether the maze is valid or not.
         """
     # single connected-component
-    labeled_array, num_features = label(maze)
+    num_features, enclosed = connectivity(maze)
 
-    npmaze = np.array(maze)
-    mx, my = npmaze.shape
+    mx, my = maze.shape
     if num_features > 1:
         return False
     # no loops
@@ -40,16 +103,8 @@ def base_check_maze(maze: np.ndarray) -> bool:
             if maze[i, j] == 1:
                 if maze[i + 1, j] == 1 and maze[i, j + 1] == 1 and maze[i + 1, j + 1] == 1:
                     return False
-    maze = maze - 1
-    s = [[1, 1, 1],
-         [1, 1, 1],
-         [1, 1, 1]]
-    labeled_array, num_features = label(maze, structure=s)
-    for feat in range(1, num_features + 1):
-        indexes = np.array(np.where(labeled_array == feat))
-        if np.all(indexes[:, :] != 0) and np.all(indexes[0, :] != mx - 1) and np.all(indexes[1, :] != my - 1):
-            return False
-    return True
+    # no walls enclosed by hallways
+    return not enclosed
 
 
 def gen_maze(mx: int, my: int) -> np.ndarray:
@@ -99,7 +154,7 @@ def gen_maze(mx: int, my: int) -> np.ndarray:
         else:
             stack.pop()
 
-    if check_maze(maze):
+    if check_mazes(maze[None])[0]:
         correct_maze = np.array(maze, dtype=np.int32)
     else:
         print(maze)
@@ -108,38 +163,206 @@ def gen_maze(mx: int, my: int) -> np.ndarray:
     return correct_maze
 
 
-def gen_maze_data(n: int, mx: int, my: int) -> torch.Tensor:
-    """Generate n mazes of size mx by my as a n x mx x my torch tensor.
-    Persists the tensor to {root}/data/mazes folder.
+def gen_mazes(n: int, mx: int, my: int, rng: np.random.RandomState = None) -> np.ndarray:
+    """Generate n mazes of shape (mx, my) at once. Runs the same depth-first search as `gen_maze`, but keeps a stack
+    per maze in an array and advances the search of all mazes by one step at a time.
 
+    Args:
+        n: The number of mazes to generate.
+        mx: The length of a maze.
+        my: The height of a maze.
+        rng: The random state to draw from. Defaults to the global numpy random state.
+
+    Returns:
+        An np.int32 array of size n x my x mx.
+    """
+    rng = np.random if rng is None else rng
+    width = mx + 2  # a padding of walls around each maze, which are never carved
+    inside = np.zeros((my + 2, width), dtype=bool)
+    inside[1:-1, 1:-1] = True
+    inside = inside.ravel()
+    directions = np.array([-width, 1, width, -1])  # the 4 directions of gen_maze
+
+    start = (rng.randint(0, my, size=n) + 1) * width + rng.randint(0, mx, size=n) + 1
+    maze = np.zeros((n, inside.size), dtype=bool)
+    maze[np.arange(n), start] = True
+    stack = np.zeros((n, mx * my), dtype=np.int32)
+    stack[:, 0] = start
+    depth = np.ones(n, dtype=np.int64)
+
+    active = np.arange(n)
+    while len(active) > 0:
+        top = stack[active, depth[active] - 1]
+        neighbours = top[:, None] + directions[None, :]
+        rows = active[:, None]
+        available = inside[neighbours] & ~maze[rows, neighbours]
+        # of occupied neighbors must be 1
+        occupied = np.zeros(neighbours.shape, dtype=np.int8)
+        for direction in directions:
+            occupied += maze[rows, np.clip(neighbours + direction, 0, inside.size - 1)]
+        available &= occupied == 1
+
+        # if 1 or more neighbors available then randomly select one and move
+        moves = available.any(axis=1)
+        choice = np.where(available, rng.rand(*available.shape), -1).argmax(axis=1)
+        moving = active[moves]
+        cells = neighbours[moves, choice[moves]]
+        maze[moving, cells] = True
+        stack[moving, depth[moving]] = cells
+        depth[moving] += 1
+        depth[active[~moves]] -= 1
+        active = active[depth[active] > 0]
+
+    mazes = maze.reshape(n, my + 2, width)[:, 1:-1, 1:-1].astype(np.int32)
+    if not check_mazes(mazes).all():
+        raise Exception('Generated an incorrect maze')
+    return mazes
+
+
+def gen_maze_data(n: int, mx: int, my: int, workers: int = 1, seed: int = None) -> torch.Tensor:
+    """Generate n unique mazes of size mx by my as a n x mx x my torch tensor.
+    Persists the tensor to {root}/data/mazes folder.
 
     Args:
         n: The number of mazes to generate.
         mx: The length of a maze.
         my: The height of a maze
+        workers: The number of processes to generate the mazes with.
+        seed: The seed of the random state the shard seeds are drawn from.
 
     Returns:
-        The tensor of generated mazes
+        The tensor of generated mazes, in the sorted order of np.unique
     """
     mazes = np.zeros([n, mx, my])
-    for i in range(n):
-        mazes[i] = gen_maze(mx, my)
-        if (i + 1) % 100 == 0:
-            print("Generated {}/{} mazes...".format(i + 1, n))
-    unique_maze = np.unique(mazes, axis = 0)
-    number_unique = len(unique_maze)
-    # print("{}/{} are unique".format(number_unique, n))
+    number_unique = 0
+    for batch in unique_mazes(n, mx, my, workers, np.random.RandomState(seed)):
+        mazes[number_unique:number_unique + len(batch)] = batch
+        number_unique += len(batch)
+
+    # sorted, like the data sets that were deduplicated with np.unique
+    mazes = torch.from_numpy(np.unique(mazes, axis=0))
+
+    return mazes
+
 
+def unique_mazes(n: int, mx: int, my: int, workers: int = 1, seeds: np.random.RandomState = None,
+                 seen: set = None) -> Iterator[np.ndarray]:
+    """Generate n unique mazes of size mx by my, batch by batch.
+
+    The mazes are generated in shards of GEN_CHUNK mazes, each with its own seed drawn from seeds. The shards do not
+    depend on the number of workers, so the same seeds give the same mazes for any number of workers. Duplicates are
+    dropped as the shards come in, by keeping the packed key of every accepted maze in a set. The mazes are yielded in
+    the order they are generated rather than sorted, so they can be written out before all of them exist.
+
+    Fails at once if n is more than the number of valid mazes of this size, when that number is known, and after a
+    round of at least GEN_CHUNK mazes without a single new one otherwise.
+
+    Args:
+        n: The number of mazes to generate.
+        mx: The length of a maze.
+        my: The height of a maze
+        workers: The number of processes to generate the shards with.
+        seeds: The random state to draw the seed of each shard from.
+        seen: The keys of mazes that were generated before and should not be repeated. New keys are added to it.
+
+    Returns:
+        An iterator over arrays of size k x my x mx holding the new unique mazes of each shard.
+    """
+    seeds = np.random.RandomState() if seeds is None else seeds
+    seen = set() if seen is None else seen
+    distinct = count_valid_mazes(mx, my)
+    if distinct is not None and n + len(seen) > distinct:
+        raise ValueError('Cannot generate {} unique {}x{} mazes, only {} distinct valid mazes exist'.format(
+            n + len(seen), mx, my, distinct))
+
+    number_unique = 0
     while number_unique != n:
-        temp_maze = gen_maze_data(n - number_unique, mx, my)
-        temp_unique = np.unique(temp_maze, axis = 0)
-        unique_maze = np.concatenate((unique_maze, temp_unique), axis=0)
-        unique_maze = np.unique(unique_maze, axis = 0)
-        number_unique = len(unique_maze)
+        found = 0
+        size = max(n - number_unique, GEN_CHUNK)
+        for shard in _gen_shards(size, mx, my, workers, seeds):
+            new = []
+            for maze, key in zip(shard, maze_keys(shard)):
+                if key not in seen:
+                    seen.add(key)
+                    new.append(maze)
+                    if number_unique + len(new) == n:
+                        break
+            number_unique += len(new)
+            found += len(new)
+            print("Generated {}/{} unique mazes...".format(number_unique, n))
+            if len(new) > 0:
+                yield np.array(new)
+            if number_unique == n:
+                break
+        if found == 0:
+            raise RuntimeError('No new unique {}x{} mazes among {} generated ones, {} is likely more than the number '
+                               'of distinct mazes the generator can produce'.format(mx, my, size, n))
+
+
+def count_valid_mazes(mx: int, my: int) -> Union[int, None]:
+    """The number of distinct valid mazes of size mx by my, if it is known. Only read from the shipped lookup tables,
+    never enumerated, so it returns at once for every size.
 
-    mazes = torch.from_numpy(unique_maze)
+    Args:
+        mx: The length of a maze.
+        my: The height of a maze
+
+    Returns:
+        The number of valid mazes for square mazes of at most LUT_MAX_SIZE that have a built bitboard lookup table, None
+        for all other sizes. Not every valid maze can be produced by the depth-first search, so this is an upper bound
+        for generated data sets.
+    """
+    if mx != my or mx > bitboard.LUT_MAX_SIZE:
+        return None
+    table = bitboard.lookup_table(mx)
+    return None if table is None else len(table)
 
-    return mazes
+
+def maze_keys(mazes: np.ndarray) -> list:
+    """Key every maze of a batch by its packed pixels. Mazes that fit in a bitboard are keyed by a single integer.
+
+    Args:
+        mazes: An array of size n x maze_length x maze_height.
+
+    Returns:
+        A list of n hashable keys.
+    """
+    n, mx, my = mazes.shape
+    if mx == my and bitboard.fits(mx):
+        return bitboard.to_bitboards(mazes).tolist()
+    return [row.tobytes() for row in np.packbits(mazes.reshape(n, -1) == 1, axis=1)]
+
+
+def _gen_shard(shard: Tuple[int, int, int, int]) -> np.ndarray:
+    """Generate a single shard of mazes from a (number of mazes, length, height, seed) tuple."""
+    n, mx, my, seed = shard
+    return gen_mazes(n, mx, my, np.random.RandomState(seed))
+
+
+def _gen_shards(n: int, mx: int, my: int, workers: int, seeds: np.random.RandomState) -> Iterator[np.ndarray]:
+    """Generate n mazes in shards of at most GEN_CHUNK mazes, spread over a pool of worker processes.
+
+    Args:
+        n: The number of mazes to generate.
+        mx: The length of a maze.
+        my: The height of a maze
+        workers: The number of processes to generate the shards with.
+        seeds: The random state to draw the seed of each shard from.
+
+    Returns:
+        An iterator over the shards, in shard order. Each shard is an array of size GEN_CHUNK x my x mx or smaller.
+    """
+    shards = [(min(GEN_CHUNK, n - i), mx, my, seeds.randint(2 ** 31)) for i in range(0, n, GEN_CHUNK)]
+    if workers <= 1:
+        for shard in shards:
+            yield _gen_shard(shard)
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            for shard in pool.imap(_gen_shard, shards):
+                yield shard
+        finally:
+            pool.terminate()
 
 
 def check_maze(maze: np.ndarray) -> bool:
@@ -187,26 +410,101 @@ def check_maze(maze: np.ndarray) -> bool:
     return base_check_maze(maze)
 
 
-def save_grid(mazes: np.ndarray, path: str) -> None:
+def check_mazes(mazes) -> np.ndarray:
+    """Checks a whole batch of mazes at once. Applies the same rules as `check_maze`, but each rule is evaluated with
+    array operations over the entire batch:
+        * there is at least one white pixel.
+        * no wall pixel has exactly one white neighbour (i.e. the hallways could not be extended any further).
+        * all white pixels are connected.
+        * there are no 2 x 2 blocks of white pixels (i.e. there are no loops).
+        * every group of wall pixels touches the border (i.e. there are no islands).
+
+    Args:
+        mazes: An array or Tensor of size n x maze_length x maze_height. Pixels equal to 1 are hallways.
+
+    Returns:
+        A boolean array of size n saying which mazes are valid. Square mazes of up to 8 x 8 are checked as bitboards.
+    """
+    if isinstance(mazes, torch.Tensor):
+        mazes = mazes.detach().cpu().numpy()
+    hallways = np.asarray(mazes) == 1
+    n, mx, my = hallways.shape
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    if mx == my and bitboard.fits(mx):
+        return bitboard.check_bitboards(bitboard.to_bitboards(hallways), mx)
+
+    # at least one white pixel
+    valid = hallways.reshape(n, -1).any(axis=1)
+
+    # no wall pixel with a single white neighbour
+    padded = np.pad(hallways, ((0, 0), (1, 1), (1, 1)), mode='constant').astype(np.int8)
+    neighbours = padded[:, :-2, 1:-1] + padded[:, 2:, 1:-1] + padded[:, 1:-1, :-2] + padded[:, 1:-1, 2:]
+    valid &= ~((neighbours == 1) & ~hallways).reshape(n, -1).any(axis=1)
+
+    # no loops
+    blocks = hallways[:, :-1, :-1] & hallways[:, 1:, :-1] & hallways[:, :-1, 1:] & hallways[:, 1:, 1:]
+    valid &= ~blocks.reshape(n, -1).any(axis=1)
+
+    # single connected-component, labelled for all mazes at once without connecting neighbouring mazes
+    cross = [[[0, 0, 0], [0, 0, 0], [0, 0, 0]],
+             [[0, 1, 0], [1, 1, 1], [0, 1, 0]],
+             [[0, 0, 0], [0, 0, 0], [0, 0, 0]]]
+    labeled_array, num_features = label(hallways, structure=cross)
+    owner = np.zeros(num_features + 1, dtype=np.int64)
+    owner[labeled_array.reshape(n, -1)] = np.arange(n)[:, None]
+    valid &= np.bincount(owner[1:], minlength=n) <= 1
+
+    # no walls enclosed by hallways
+    square = [[[0, 0, 0], [0, 0, 0], [0, 0, 0]],
+              [[1, 1, 1], [1, 1, 1], [1, 1, 1]],
+              [[0, 0, 0], [0, 0, 0], [0, 0, 0]]]
+    labeled_array, num_features = label(~hallways, structure=square)
+    border = np.ones((mx, my), dtype=bool)
+    border[1:-1, 1:-1] = False
+    touches_border = np.zeros(num_features + 1, dtype=bool)
+    touches_border[labeled_array[:, border]] = True
+    owner = np.zeros(num_features + 1, dtype=np.int64)
+    owner[labeled_array.reshape(n, -1)] = np.arange(n)[:, None]
+    islands = ~touches_border
+    islands[0] = False
+    valid &= np.bincount(owner[islands], minlength=n) == 0
+
+    return valid
+
+
+def save_grid(mazes: np.ndarray, path: str, nrow: int = 5, cell: int = 96, padding: int = 6) -> None:
     """Save a sample of the first 25 mazes in the mini batch as a 5x5 grid of images. Used for visual inspection
-    of the results.
+    of the results. The grid is drawn straight into an image buffer, every maze scaled up by a whole number of pixels,
+    and written with PIL, so the cost of a call does not grow over a run the way repeated matplotlib figures do.
 
     Args:
         mazes: An array of size batch_size x maze_length x maze_height
-        path: The path to the file where the grid will be persisted.
-
-    Todo:
-        Make grid size and sample size dynamic.
+        path: The path to the file where the grid will be persisted. Saved as a PNG, '.png' is appended if the path
+            has no extension.
+        nrow: The number of mazes in a row and in a column of the grid.
+        cell: The size in pixels a maze is scaled up to, rounded down to a multiple of its size.
+        padding: The number of grey pixels between the mazes.
     """
-    fig = plt.figure(1, dpi=160)
+    mazes = np.asarray(mazes, dtype=np.float32)[:nrow * nrow]
+    _, mx, my = mazes.shape
+    scale = max(1, cell // max(mx, my))
+
+    # scale every maze between its own darkest and lightest pixel, like imshow does
+    low = mazes.min(axis=(1, 2), keepdims=True)
+    high = mazes.max(axis=(1, 2), keepdims=True)
+    pixels = np.where(high > low, (mazes - low) / np.maximum(high - low, 1e-12), 0)
+    pixels = (pixels * 255).round().astype(np.uint8).repeat(scale, axis=1).repeat(scale, axis=2)
 
-    grid = ImageGrid(fig, 111, nrows_ncols=(5, 5), axes_pad=0.04, )
-    for i in range(25):
-        grid[i].imshow(mazes[i, :, :], cmap='gray')
-        grid[i].axes.get_xaxis().set_visible(False)
-        grid[i].axes.get_yaxis().set_visible(False)
+    width, height = mx * scale + padding, my * scale + padding
+    image = np.full((nrow * width - padding, nrow * height - padding), 128, dtype=np.uint8)
+    for i, maze in enumerate(pixels):
+        row, col = divmod(i, nrow)
+        image[row * width:row * width + mx * scale, col * height:col * height + my * scale] = maze
 
-    plt.savefig(path, dpi=160, bbox_inches='tight')
+    if os.path.splitext(path)[1] == '':
+        path += '.png'
+    Image.fromarray(image).save(path, format='PNG')
 
 
 def draw(maze: np.ndarray) -> None:
@@ -223,11 +521,13 @@ if __name__ == '__main__':
     parser.add_argument('-n', '--number', type=int, default=60000, help='number of mazes to generate')
     parser.add_argument('-s', '--size', type=int, default=8, help='the size of a maze, only square mazes are allowed')
     parser.add_argument('-p', '--path', type=str, default=None, help='where to save the images')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='number of processes to generate mazes with')
+    parser.add_argument('--seed', type=int, default=None, help='seed for reproducible data sets')
     opts = parser.parse_args()
 
     if opts.action == 'generate':
         print('Generating {} {}x{} mazes'.format(opts.number, opts.size, opts.size))
-        data = gen_maze_data(opts.number, opts.size, opts.size)
+        data = gen_maze_data(opts.number, opts.size, opts.size, opts.workers, opts.seed)
         print("Training data contains only unique mazes now")
         print('Persisting data to file {}.{}x{}.data '.format(opts.number, opts.size, opts.size))
         path = os.path.join(ROOT, 'data', 'mazes', '{}.{}x{}.data.tar'.format(opts.number, opts.size, opts.size))
@@ -0,0 +1,44 @@
+"""
+BIT-PACKED MAZES
+Mazes only hold 0's and 1's, so every row of a maze is stored as bits with np.packbits: a square maze of size s takes
+s * ceil(s / 8) bytes instead of s * s floats. Packed arrays are saved as plain .npy files, so they can be memory mapped.
+"""
+import numpy as np
+
+SUFFIX = '.bits.npy'
+
+
+def pack_mazes(mazes: np.ndarray) -> np.ndarray:
+    """Pack a batch of mazes into bits, row by row.
+
+    Args:
+        mazes: An array of size n x maze_size x maze_size. Pixels equal to 1 are hallways, all others are walls.
+
+    Returns:
+        An np.uint8 array of size n x maze_size x ceil(maze_size / 8).
+    """
+    return np.packbits(np.asarray(mazes) == 1, axis=-1)
+
+
+def unpack_mazes(packed: np.ndarray, width: int = None) -> np.ndarray:
+    """Unpack a batch of mazes packed with `pack_mazes`.
+
+    Args:
+        packed: An np.uint8 array of size n x maze_size x ceil(maze_size / 8).
+        width: The length of the last axis of the mazes. Defaults to square mazes.
+
+    Returns:
+        An np.uint8 array of size n x maze_size x maze_size.
+    """
+    width = packed.shape[-2] if width is None else width
+    return np.unpackbits(np.asarray(packed), axis=-1)[..., :width]
+
+
+def save_packed(mazes: np.ndarray, path: str) -> None:
+    """Pack a batch of mazes and persist it to path, which should end with SUFFIX."""
+    np.save(path, pack_mazes(mazes))
+
+
+def load_packed(path: str, width: int = None) -> np.ndarray:
+    """Load and unpack a batch of mazes persisted with `save_packed`."""
+    return unpack_mazes(np.load(path), width)
@@ -1,9 +1,9 @@
 import os
 import csv
-import glob
 import random
 import importlib
 import helpers.evaluation as ev
+from helpers.eval_index import sample_files
 from time import gmtime, strftime
 
 csv_file = None
@@ -54,12 +54,8 @@ def begin_search(opt: {}):
         model = importlib.import_module('.'.join(['models', opt.model, opt.model]))
         model.run(opt)
 
-        samples_path = os.path.abspath(
-            os.path.join('models', opt.model, 'samples', model.LOGGER.run, '*.sample.tar'))
-        sample_files = glob.glob(samples_path)
-        sample_files.sort()
-
-        correct_amount = ev.check_ind(sample_files)
+        samples_path = os.path.abspath(os.path.join('models', opt.model, 'samples', model.LOGGER.run))
+        correct_amount = ev.check_ind(sample_files(samples_path))
         save_results(model.LOGGER, opt, correct_amount)
     close_file()
 
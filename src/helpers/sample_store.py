@@ -0,0 +1,145 @@
+"""
+SAMPLE STORES
+All generated samples of a run are appended to a single file, samples.store, as bit-packed mazes (see helpers.packing).
+A csv index next to it, samples.index.csv, lists the step, offset, number of mazes and maze size of every sample, so
+any sample is read with a single seek. A long run thus writes two files instead of one file per sample interval.
+
+A sample in a store is referred to by the path {sample_path}/samples.store/fake_{step}, which mirrors the name of a
+sample file, so the evaluation lists, indexes and loads both in the same way.
+"""
+from typing import Dict, Iterator, List, Tuple
+from collections import namedtuple
+from helpers import packing
+import numpy as np
+import csv
+import os
+
+STORE_FILE = 'samples.store'
+INDEX_FILE = 'samples.index.csv'
+
+# A sample in the store: its global step, the byte offset in the store, the number of mazes and the maze size.
+Entry = namedtuple('Entry', ['step', 'offset', 'count', 'size'])
+
+# The indexes read by `read_entry`, by store path, with the size of the index file they were read at.
+_indexes = {}
+
+
+class SampleStore:
+    def __init__(self, sample_path: str) -> None:
+        """Open the sample store of a run. Appending to a store that already exists, e.g. when resuming, continues
+        after its last sample.
+
+        Args:
+            sample_path: The samples folder of a run, i.e. {module}/samples/{run}.
+        """
+        self.path = os.path.join(sample_path, STORE_FILE)
+        self.index_path = os.path.join(sample_path, INDEX_FILE)
+        self.data_file = None
+        self.index_file = None
+
+    def append(self, mazes: np.ndarray, step: int) -> None:
+        """Add the sample of a step to the end of the store. The mazes are written and flushed before their index row,
+        so an interrupted append leaves no index row pointing at missing data.
+
+        Args:
+            mazes: An array of size n x maze_size x maze_size.
+            step: The current global step.
+        """
+        if self.data_file is None:
+            self.data_file = open(self.path, 'ab')
+            new_index = not os.path.exists(self.index_path)
+            self.index_file = open(self.index_path, 'a', newline='')
+            self.index_writer = csv.writer(self.index_file, delimiter=',')
+            if new_index:
+                self.index_writer.writerow(Entry._fields)
+
+        packed = packing.pack_mazes(mazes)
+        offset = self.data_file.tell()
+        self.data_file.write(packed.tobytes())
+        self.data_file.flush()
+        self.index_writer.writerow([step, offset, packed.shape[0], packed.shape[1]])
+        self.index_file.flush()
+
+    def close(self) -> None:
+        if self.data_file is not None:
+            self.data_file.close()
+            self.index_file.close()
+            self.data_file = None
+
+    def entries(self) -> List[Entry]:
+        """The samples in the store, in the order of their steps. If a step was stored more than once, which happens
+        when a run is resumed from an earlier checkpoint, the last one is kept.
+        """
+        return sorted(read_index(self.index_path).values())
+
+    def paths(self) -> List[str]:
+        """The paths that refer to the samples in the store, see `read_entry`."""
+        return [entry_path(self.path, entry.step) for entry in self.entries()]
+
+    def read(self, entry: Entry) -> np.ndarray:
+        """Load the mazes of an entry, an array of size n x maze_size x maze_size."""
+        return _read(self.path, entry)
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """Read the samples one after the other, as pairs of the step and its mazes."""
+        for entry in self.entries():
+            yield entry.step, self.read(entry)
+
+
+def read_index(index_path: str) -> Dict[int, Entry]:
+    """Read the index of a store.
+
+    Args:
+        index_path: The path to the index file.
+
+    Returns:
+        The entries of the index by step. An empty dict if the store does not exist.
+    """
+    entries = {}
+    if os.path.exists(index_path):
+        with open(index_path, newline='') as file:
+            for row in csv.DictReader(file):
+                entry = Entry(*(int(row[field]) for field in Entry._fields))
+                entries[entry.step] = entry
+    return entries
+
+
+def entry_path(store_path: str, step: int) -> str:
+    """The path that refers to the sample of a step in a store."""
+    return os.path.join(store_path, 'fake_{0:0=8d}'.format(step))
+
+
+def is_entry(path: str) -> bool:
+    """Whether a path refers to a sample in a store rather than to a sample file."""
+    return os.path.basename(os.path.dirname(path)) == STORE_FILE
+
+
+def find_entry(path: str) -> Tuple[str, Entry]:
+    """Look up the store and index entry a path refers to. The index of a store is only read again when it grew.
+
+    Args:
+        path: A path made by `entry_path`.
+
+    Returns:
+        The path of the store and the entry.
+    """
+    store_path = os.path.dirname(path)
+    index_path = os.path.join(os.path.dirname(store_path), INDEX_FILE)
+    index_size = os.path.getsize(index_path)
+    if store_path not in _indexes or _indexes[store_path][0] != index_size:
+        _indexes[store_path] = (index_size, read_index(index_path))
+    step = int(os.path.basename(path).split('_')[1])
+    return store_path, _indexes[store_path][1][step]
+
+
+def read_entry(path: str) -> np.ndarray:
+    """Load the sample a path made by `entry_path` refers to, an array of size n x maze_size x maze_size."""
+    return _read(*find_entry(path))
+
+
+def _read(store_path: str, entry: Entry) -> np.ndarray:
+    row_bytes = (entry.size + 7) // 8
+    with open(store_path, 'rb') as file:
+        file.seek(entry.offset)
+        packed = np.fromfile(file, dtype=np.uint8, count=entry.count * entry.size * row_bytes)
+    return packing.unpack_mazes(packed.reshape(entry.count, entry.size, row_bytes), entry.size)
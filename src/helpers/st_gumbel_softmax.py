@@ -75,3 +75,38 @@ def straight_through(logits: Variable, tau: float, hard=True) -> Variable:
         return quantize(y)[:, :, -1]
     else:
         return y[:, :, 1]
+
+
+class BinaryStraightThrough(torch.autograd.Function):
+    """The straight-through Gumbel-Softmax estimator for two categories. The difference of two Gumbel samples follows a
+    logistic distribution, so a pixel is white when its logit plus a single logistic sample is positive, and the
+    gradient is the one of the relaxed sample sigmoid((logit + noise) / tau)."""
+
+    @staticmethod
+    def forward(ctx, logits: torch.Tensor, tau: float, eps: float = 1e-20) -> torch.Tensor:
+        u = torch.rand_like(logits)
+        noisy = logits + torch.log(u + eps) - torch.log(1 - u + eps)
+        ctx.tau = tau
+        ctx.save_for_backward(torch.sigmoid(noisy / tau))
+        return (noisy > 0).type_as(logits)
+
+    @staticmethod
+    def backward(ctx, grad_output: torch.Tensor):
+        soft, = ctx.saved_tensors
+        return grad_output * soft * (1 - soft) / ctx.tau, None, None
+
+
+def binary_straight_through(logits: Variable, tau: float) -> Variable:
+    """Sample binary pixels from the the Gumbel-Softmax distribution with a single noise sample per pixel. Gives the
+    same samples and gradients as `straight_through` with hard=True on the log-probabilities of black and white, without
+    building the two categories.
+
+    Args:
+        logits: The log-odds of a pixel being white, i.e. log p(white) - log p(black), of any shape.
+        tau: A number used to smooth the distribution | the higher the temperature, the closer you get
+            to the original categorical distribution.
+
+    Returns:
+        The quantized Variable representing the pixel values, in the same shape as the logits.
+    """
+    return BinaryStraightThrough.apply(logits, tau)
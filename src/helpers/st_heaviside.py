@@ -1,15 +1,21 @@
 import torch
 from torch.autograd import Variable
 
-TENSOR = torch.cuda.FloatTensor if torch.cuda.is_available() else torch.FloatTensor
-
 
 def heaviside(x: Variable):
-    ones = torch.ones_like(x).type(TENSOR)
-    zeros = torch.zeros_like(x).type(TENSOR)
-    x_hard = torch.where(x >= 0, ones, zeros).type(TENSOR)
+    return (x >= 0).type_as(x)
+
+
+class StraightThrough(torch.autograd.Function):
+    """The Heaviside function in the forward pass and the identity in the backward pass."""
 
-    return x_hard
+    @staticmethod
+    def forward(ctx, x: torch.Tensor) -> torch.Tensor:
+        return heaviside(x)
+
+    @staticmethod
+    def backward(ctx, grad_output: torch.Tensor) -> torch.Tensor:
+        return grad_output
 
 
 def straight_through(x: Variable) -> Variable:
@@ -22,7 +28,4 @@ def straight_through(x: Variable) -> Variable:
     Returns:
         A discretized Variable that retains the gradient from the original representation.
     """
-
-    x_hard = heaviside(x)
-
-    return (x_hard - x).detach() + x
+    return StraightThrough.apply(x)
@@ -0,0 +1,327 @@
+"""
+TRAINER
+The training loop that every model shares. A model only defines its generator, discriminator and optimizers and picks an
+objective, the trainer takes care of the data, checkpoints and logging:
+
+    trainer = Trainer(CWD, RUN, args, generator, discriminator, optimizer_g, optimizer_d, Adversarial())
+    trainer.train(data_loader.load(args, opts))
+"""
+from argparse import Namespace
+from collections import namedtuple
+from typing import Callable, Union
+
+from helpers.checkpoint import Checkpoint
+from helpers.logger import Logger
+from torch.autograd import Variable
+import torch.nn as nn
+import torch
+import time
+
+CUDA = True if torch.cuda.is_available() else False
+TENSOR = torch.cuda.FloatTensor if CUDA else torch.FloatTensor
+
+# The outcome of a training step that updated the generator. Scores are None for objectives without probabilities.
+Step = namedtuple('Step', ['d_loss', 'g_loss', 'real_scores', 'fake_scores', 'fake_images'])
+
+
+class Trainer:
+    def __init__(self, module_path: str, run: str, args: Namespace, generator: nn.Module, discriminator: nn.Module,
+                 optimizer_g: torch.optim.Optimizer, optimizer_d: torch.optim.Optimizer,
+                 objective: Union['Adversarial', 'Wasserstein'], input_shape: tuple = None,
+                 quantizer: Callable[[Variable], Variable] = None, noise: Callable[[int], Variable] = None,
+                 maze_size: int = None, real_grid_once: bool = True) -> None:
+        """Prepare a generator and discriminator for training. Maps them to CUDA if necessary, creates the checkpoint
+        handlers and the logger, and loads the last checkpoint when resuming.
+
+        Args:
+            module_path: The path to the module of the model. Retrievable with `os.path.abspath(__file__)`
+            run: An id of the current run. Replaced by the id of the checkpoint when resuming.
+            args: The CLI arguments.
+            generator: The generator, already initialized.
+            discriminator: The discriminator, already initialized.
+            optimizer_g: The optimizer of the generator.
+            optimizer_d: The optimizer of the discriminator.
+            objective: How a batch is trained on, i.e. `Adversarial` or `Wasserstein`.
+            input_shape: The shape of a single real example as the discriminator expects it, e.g. (1, -1) for flat
+                mazes. If None, the batches are used as they come.
+            quantizer: An optional function to discretize the output of the generator with.
+            noise: An optional function that samples the generator input for a batch of a size. Defaults to standard
+                normal noise from torch.
+            maze_size: If set, the generated samples are mazes of this size. Before they are logged, they are reshaped
+                to maze_size x maze_size, rounded to walls and hallways and checked for validity.
+            real_grid_once: Whether to save the grid of real images only at the first sample interval, rather than at
+                every interval. Only used with --log_details.
+        """
+        self.args = args
+        self.generator = generator
+        self.discriminator = discriminator
+        self.optimizer_g = optimizer_g
+        self.optimizer_d = optimizer_d
+        self.objective = objective
+        self.input_shape = input_shape
+        self.quantizer = quantizer
+        self.sample_noise = noise
+        self.maze_size = maze_size
+        self.real_grid_once = real_grid_once
+
+        # the forward passes, replaced by compiled ones with --compile
+        self.forward_g = generator
+        self.forward_d = discriminator
+        self.compiled = False
+        if args.compile and not hasattr(torch, 'compile'):
+            raise RuntimeError('--compile needs torch.compile, which is only available from torch 2.0 on')
+
+        # Map to CUDA if necessary
+        if CUDA:
+            generator.cuda()
+            discriminator.cuda()
+            objective.cuda()
+
+        # Create checkpoint handler and load state if required
+        self.current_epoch = 0
+        self.checkpoint_g = Checkpoint(module_path, generator, optimizer_g)
+        self.checkpoint_d = Checkpoint(module_path, discriminator, optimizer_d)
+        if args.resume:
+            run, self.current_epoch = self.checkpoint_g.load()
+            _, _ = self.checkpoint_d.load()
+            print('Loaded models from disk. Starting at epoch {}.'.format(self.current_epoch + 1))
+        self.run = run
+        self.logger = Logger(module_path, run, args)
+
+    def noise(self, n: int) -> Variable:
+        """Sample noise as generator input."""
+        if self.sample_noise is not None:
+            return self.sample_noise(n)
+        return Variable(torch.randn(n, self.args.latent_dim).type(TENSOR))
+
+    def generate(self, z: Variable) -> Variable:
+        """Generate a batch of images, quantized if the model has a quantizer."""
+        images = self.forward_g(z)
+        return images if self.quantizer is None else self.quantizer(images)
+
+    def discriminate(self, images: Variable) -> Variable:
+        """Score a batch of images with the discriminator."""
+        return self.forward_d(images)
+
+    def compile(self) -> None:
+        """Compile the forward passes of the generator and discriminator, the quantizer and the losses of the objective
+        into fused graphs with torch.compile, which needs torch 2.0 or later. The compiled passes share the parameters
+        of the original modules, so the optimizers and checkpoints are unaffected.
+        """
+        self.forward_g = torch.compile(self.generator)
+        self.forward_d = torch.compile(self.discriminator)
+        if self.quantizer is not None:
+            self.quantizer = torch.compile(self.quantizer)
+        self.objective.compile(torch.compile)
+        self.compiled = True
+
+    def train(self, batches) -> None:
+        """Train for the remaining epochs, saving checkpoints after every epoch. Closes the batches when done, if they
+        have a close() method.
+
+        Args:
+            batches: The iterable over the batches of the data set, see `data_loader.load`.
+        """
+        for epoch in range(self.current_epoch, self.args.n_epochs):
+            start = time.perf_counter()
+            timed_from = 0
+            for i, images in enumerate(batches):
+                # Configure input
+                if self.input_shape is not None:
+                    images = images.reshape(images.size(0), *self.input_shape)
+                real_images = Variable(images.type(TENSOR))
+                warm_up = self.args.compile and not self.compiled
+                if warm_up:
+                    self.compile()
+
+                batches_done = epoch * len(batches) + i + 1
+                step = self.objective.step(self, real_images, batches_done)
+                if step is not None and batches_done % self.args.sample_interval == 0:
+                    self.log(epoch, i + 1, len(batches), batches_done, real_images, step)
+
+                # the first compiled step also compiles, so it is reported apart from the steps per second
+                if warm_up:
+                    if CUDA:
+                        torch.cuda.synchronize()
+                    print('[Compiled in %.1f sec]' % (time.perf_counter() - start))
+                    start = time.perf_counter()
+                    timed_from = i + 1
+
+            if CUDA:
+                torch.cuda.synchronize()
+            steps_per_sec = (len(batches) - timed_from) / (time.perf_counter() - start)
+            if self.compiled:
+                print('[Epoch %d/%d] [%.1f steps/sec, compiled]' % (epoch + 1, self.args.n_epochs, steps_per_sec))
+            self.logger.log_tensorboard_steps_per_sec(steps_per_sec, (epoch + 1) * len(batches))
+
+            # -- Save model checkpoints after each epoch -- #
+            self.checkpoint_g.save(self.run, epoch)
+            self.checkpoint_d.save(self.run, epoch)
+        if hasattr(batches, 'close'):
+            batches.close()
+        self.logger.close_writers()
+
+    def log(self, epoch: int, batch: int, n_batches: int, batches_done: int, real_images: Variable,
+            step: Step) -> None:
+        """Log the generated sample and the statistics of a step. If the trainer has a maze size, generated mazes are
+        rounded to walls and hallways and checked for validity.
+
+        Args:
+            epoch: The current epoch.
+            batch: The current batch.
+            n_batches: Total number of batches in an epoch.
+            batches_done: The current global step.
+            real_images: The training images of the step.
+            step: The outcome of the step.
+        """
+        fake_images = step.fake_images.detach()
+        if self.maze_size is not None:
+            fake_images = fake_images.reshape(-1, self.maze_size, self.maze_size).clone()
+            fake_images[fake_images < 0.5] = 0
+            fake_images[fake_images > 0.5] = 1
+            real_images = real_images.reshape(-1, self.maze_size, self.maze_size)
+
+        self.logger.log_generated_sample(fake_images, batches_done)
+
+        self.logger.log_batch_statistics(epoch, self.args.n_epochs, batch, n_batches, step.d_loss, step.g_loss,
+                                         step.real_scores, step.fake_scores)
+
+        self.logger.log_tensorboard_basic_data(step.g_loss, step.d_loss, step.real_scores, step.fake_scores,
+                                               batches_done)
+        if self.maze_size is not None:
+            self.logger.log_tensorboard_maze_validity(fake_images, batches_done)
+
+        if self.args.log_details:
+            if batches_done == self.args.sample_interval or not self.real_grid_once:
+                self.logger.save_image_grid(real_images, fake_images, batches_done)
+            else:
+                self.logger.save_image_grid(None, fake_images, batches_done)
+
+
+class Adversarial:
+    def __init__(self, generator_loss: Callable[[Variable], Variable] = None) -> None:
+        """The standard GAN objective. Every batch first trains the generator, then the discriminator, with binary
+        cross entropy against noisy labels.
+
+        Args:
+            generator_loss: An optional loss of the generator on the discriminator scores of its images, e.g. the
+                boundary seeking loss. Defaults to binary cross entropy against the valid labels.
+        """
+        self.adversarial_loss = nn.BCELoss()
+        self.generator_loss = generator_loss
+
+    def cuda(self) -> None:
+        self.adversarial_loss.cuda()
+
+    def compile(self, compiler: Callable) -> None:
+        self.adversarial_loss = compiler(self.adversarial_loss)
+        if self.generator_loss is not None:
+            self.generator_loss = compiler(self.generator_loss)
+
+    def step(self, trainer: Trainer, real_images: Variable, batches_done: int) -> Step:
+        # Adversarial ground truths with noise
+        valid = 0.8 + torch.rand(real_images.size(0), 1).type(TENSOR) * 0.3
+        valid = Variable(valid, requires_grad=False)
+        fake = torch.rand(real_images.size(0), 1).type(TENSOR) * 0.3
+        fake = Variable(fake, requires_grad=False)
+
+        # -----------------
+        #  Train Generator
+        # -----------------
+
+        trainer.optimizer_g.zero_grad()
+
+        fake_images = trainer.generate(trainer.noise(real_images.size(0)))
+
+        # Loss measures generator's ability to fool the discriminator
+        if self.generator_loss is None:
+            g_loss = self.adversarial_loss(trainer.discriminate(fake_images), valid)
+        else:
+            g_loss = self.generator_loss(trainer.discriminate(fake_images))
+
+        g_loss.backward()
+        trainer.optimizer_g.step()
+
+        # ---------------------
+        #  Train Discriminator
+        # ---------------------
+
+        trainer.optimizer_d.zero_grad()
+
+        # Measure discriminator's ability to classify real from generated samples
+        real_scores = trainer.discriminate(real_images)
+        real_loss = self.adversarial_loss(real_scores, valid)
+        fake_scores = trainer.discriminate(fake_images.detach())
+        fake_loss = self.adversarial_loss(fake_scores, fake)
+        d_loss = (real_loss + fake_loss) / 2
+
+        d_loss.backward()
+        trainer.optimizer_d.step()
+
+        return Step(d_loss, g_loss, real_scores, fake_scores, fake_images)
+
+
+class Wasserstein:
+    def __init__(self, n_critic: int, clip_value: float) -> None:
+        """The Wasserstein GAN objective. Every batch trains the critic and clips its weights, the generator is only
+        trained every n_critic batches.
+
+        Args:
+            n_critic: The number of batches per generator step.
+            clip_value: The lower and upper clip value of the critic weights.
+        """
+        self.n_critic = n_critic
+        self.clip_value = clip_value
+
+    def cuda(self) -> None:
+        pass
+
+    def compile(self, compiler: Callable) -> None:
+        self.critic_loss = compiler(self.critic_loss)
+        self.generator_loss = compiler(self.generator_loss)
+
+    @staticmethod
+    def critic_loss(real_scores: Variable, fake_scores: Variable) -> Variable:
+        return -torch.mean(real_scores) + torch.mean(fake_scores)
+
+    @staticmethod
+    def generator_loss(fake_scores: Variable) -> Variable:
+        return -torch.mean(fake_scores)
+
+    def step(self, trainer: Trainer, real_images: Variable, batches_done: int) -> Union[Step, None]:
+        # ---------------------
+        #  Train Discriminator
+        # ---------------------
+
+        trainer.optimizer_d.zero_grad()
+
+        z = trainer.noise(real_images.size(0))
+        fake_images = trainer.generate(z).detach()
+        # Adversarial loss
+        loss_d = self.critic_loss(trainer.discriminate(real_images), trainer.discriminate(fake_images))
+
+        loss_d.backward()
+        trainer.optimizer_d.step()
+
+        # Clip weights of discriminator
+        for p in trainer.discriminator.parameters():
+            p.data.clamp_(-self.clip_value, self.clip_value)
+
+        # Train the generator every n_critic iterations
+        if batches_done % self.n_critic != 0:
+            return None
+
+        # -----------------
+        #  Train Generator
+        # -----------------
+
+        trainer.optimizer_g.zero_grad()
+
+        fake_images = trainer.generate(z)
+        # Adversarial loss
+        loss_g = self.generator_loss(trainer.discriminate(fake_images))
+
+        loss_g.backward()
+        trainer.optimizer_g.step()
+
+        return Step(loss_d, loss_g, None, None, fake_images)
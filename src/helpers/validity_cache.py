@@ -0,0 +1,96 @@
+from collections import OrderedDict
+from typing import Union
+from helpers import maze_utils
+import numpy as np
+import torch
+import os
+
+
+class ValidityCache:
+    def __init__(self, max_size: int = 1000000, path: Union[str, None] = None) -> None:
+        """Remember whether mazes are valid, so that mazes a generator produces over and over are only checked once.
+        The least recently used mazes are forgotten once the cache holds max_size of them.
+
+        Args:
+            max_size: The maximum number of mazes to remember.
+            path: An optional file to load the cache from and to persist it to with `save`.
+        """
+        self.max_size = max_size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        if path is not None and os.path.exists(path):
+            self.entries.update(torch.load(path))
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def keys(self, mazes: np.ndarray) -> list:
+        """Key every maze in a batch by its shape and its bit-packed pixels.
+
+        Args:
+            mazes: An array of size n x maze_length x maze_height. Pixels equal to 1 are hallways.
+
+        Returns:
+            A list of n keys.
+        """
+        n, mx, my = mazes.shape
+        packed = np.packbits((mazes == 1).reshape(n, -1), axis=1)
+        return [(mx, my, row.tobytes()) for row in packed]
+
+    def check(self, mazes) -> np.ndarray:
+        """Check a batch of mazes, validating only the ones that are not in the cache yet.
+
+        Args:
+            mazes: An array or Tensor of size n x maze_length x maze_height.
+
+        Returns:
+            A boolean array of size n saying which mazes are valid.
+        """
+        if isinstance(mazes, torch.Tensor):
+            mazes = mazes.detach().cpu().numpy()
+        keys = self.keys(mazes)
+        valid = np.zeros(len(keys), dtype=bool)
+        missing = []
+        for idx, key in enumerate(keys):
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                valid[idx] = self.entries[key]
+                self.hits += 1
+            else:
+                missing.append(idx)
+                self.misses += 1
+
+        if len(missing) > 0:
+            checked = maze_utils.check_mazes(mazes[missing])
+            valid[missing] = checked
+            for idx, check in zip(missing, checked):
+                self.entries[keys[idx]] = bool(check)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return valid
+
+    def update(self, entries: dict, hits: int = 0, misses: int = 0) -> None:
+        """Add mazes that were checked elsewhere, e.g. by a copy of the cache in a worker process.
+
+        Args:
+            entries: Whether each maze is valid, by its key, see `keys`.
+            hits: The number of cache hits to add to the statistics.
+            misses: The number of cache misses to add to the statistics.
+        """
+        self.entries.update(entries)
+        self.hits += hits
+        self.misses += misses
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        return 'cache: {} hits / {} lookups ({:.1%}), {} mazes stored'.format(
+            self.hits, total, self.hits / total if total > 0 else 0, len(self.entries))
+
+    def save(self) -> None:
+        """Persist the cache to the path it was created with, if any."""
+        if self.path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            torch.save(self.entries, self.path)
@@ -1,6 +1,6 @@
 import argparse
 
-from helpers import maze_utils
+from helpers import maze_utils, maze_shards, packing
 import os
 import torch
 
@@ -11,17 +11,29 @@ if __name__ == '__main__':
     parser.add_argument('-a', '--action', type=str, help='the action to take: create.')
     parser.add_argument('-n', '--n_examples', type=int, help='the data set to use. possible values: mnist, mazes.')
     parser.add_argument('-s', '--size', type=int, help='size of the maze to create.')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='number of processes to generate mazes with.')
+    parser.add_argument('--shard_size', type=int, default=None,
+                        help='write a sharded data set with this many mazes per shard, resuming an earlier attempt.')
+    parser.add_argument('--packed', action='store_true', help='store the mazes as bits instead of a float tensor.')
+    parser.add_argument('--seed', type=int, default=None, help='seed for reproducible data sets.')
     args = parser.parse_args()
 
     print(args)
 
-    if args.action == 'create':
-        mazes = maze_utils.gen_maze_data(args.n_examples, args.size, args.size)
-        print('Persisting data to file {}.{}x{}.data.tar'.format(args.n_examples, args.size, args.size))
+    if args.action == 'create' and args.shard_size is not None:
+        path = maze_shards.write_shards(args.n_examples, args.size, args.size, args.shard_size, args.workers, args.seed)
+        print('Persisted data to shards in {}'.format(path))
+    elif args.action == 'create':
+        mazes = maze_utils.gen_maze_data(args.n_examples, args.size, args.size, args.workers, args.seed)
+        extension = packing.SUFFIX if args.packed else '.tar'
+        print('Persisting data to file {}.{}x{}.data{}'.format(args.n_examples, args.size, args.size, extension))
         ROOT = os.path.abspath(os.path.join(os.getcwd(), '..'))
 
         directory = os.path.join(ROOT, 'data', 'mazes')
-        path = os.path.join(directory, '{}.{}x{}.data.tar'.format(args.n_examples, args.size, args.size))
+        path = os.path.join(directory, '{}.{}x{}.data{}'.format(args.n_examples, args.size, args.size, extension))
         if not os.path.exists(directory):
             os.makedirs(directory)
-        torch.save(mazes, path)
\ No newline at end of file
+        if args.packed:
+            packing.save_packed(mazes.numpy(), path)
+        else:
+            torch.save(mazes, path)
\ No newline at end of file
@@ -1,11 +1,9 @@
 from argparse import Namespace
 
-from helpers.checkpoint import Checkpoint
 from helpers import st_gumbel_softmax
-from torch.autograd import Variable
 
 from helpers.initialization import weights_init_xavier
-from helpers.logger import Logger
+from helpers.trainer import Trainer, Adversarial
 from helpers import data_loader
 from datetime import datetime
 import torch.nn as nn
@@ -17,9 +15,6 @@ ROOT = os.path.abspath(os.path.join(os.getcwd(), '..'))
 CWD = os.path.dirname(os.path.abspath(__file__))
 RUN = datetime.today().strftime('%Y-%m-%d/%H-%M-%S')
 
-CUDA = True if torch.cuda.is_available() else False
-TENSOR = torch.cuda.FloatTensor if CUDA else torch.FloatTensor
-
 LOGGER = None
 
 
@@ -48,12 +43,10 @@ def run(args: Namespace):
                 *block(1024, 2048),
                 nn.Linear(2048, int(np.prod(img_shape)) * 2),
             )
-            self.LogSoftmax = nn.LogSoftmax(dim=-1)
 
         def forward(self, z_batch):
-            img_probs = self.model(z_batch)
-            img_logits = self.LogSoftmax(img_probs.view(args.batch_size, -1, 2))
-            img = st_gumbel_softmax.straight_through(img_logits, args.temp, True)
+            img_logits = self.model(z_batch).view(args.batch_size, -1, 2)
+            img = st_gumbel_softmax.binary_straight_through(img_logits[:, :, 1] - img_logits[:, :, 0], args.temp)
 
             return img.view(img.size(0), *img_shape)
 
@@ -75,8 +68,6 @@ def run(args: Namespace):
             validity = self.model(img_flat)
             return validity
 
-    adversarial_loss = torch.nn.BCELoss()
-
     # Initialize generator and discriminator
     generator = Generator()
     discriminator = Discriminator()
@@ -85,96 +76,18 @@ def run(args: Namespace):
     optimizer_g = torch.optim.Adam(generator.parameters(), lr=args.g_lr)
     optimizer_d = torch.optim.Adam(discriminator.parameters(), lr=args.d_lr)
 
-    # Map to CUDA if necessary
-    if CUDA:
-        generator.cuda()
-        discriminator.cuda()
-        adversarial_loss.cuda()
-
     # Initialize weights
     generator.apply(weights_init_xavier)
     discriminator.apply(weights_init_xavier)
 
-    # Create checkpoint handler and load state if required
-    current_epoch = 0
-    checkpoint_g = Checkpoint(CWD, generator, optimizer_g)
-    checkpoint_d = Checkpoint(CWD, discriminator, optimizer_d)
-    if args.resume:
-        RUN, current_epoch = checkpoint_g.load()
-        _, _ = checkpoint_d.load()
-        LOGGER = Logger(CWD, RUN, args)
-        print('Loaded models from disk. Starting at epoch {}.'.format(current_epoch + 1))
-    else:
-        LOGGER = Logger(CWD, RUN, args)
+    objective = Adversarial()
+    trainer = Trainer(CWD, RUN, args, generator, discriminator, optimizer_g, optimizer_d, objective)
+    LOGGER = trainer.logger
+    RUN = trainer.run
 
     # Configure data loader
     opts = {
         'binary': True,
         'crop': 20
     }
-    mnist_loader = data_loader.load(args, opts)
-
-    for epoch in range(current_epoch, args.n_epochs):
-        for i, imgs in enumerate(mnist_loader):
-
-            # Adversarial ground truths with noise
-            valid = 0.8 + torch.rand(imgs.shape[0], 1).type(TENSOR) * 0.3
-            valid = Variable(valid, requires_grad=False)
-            fake = torch.rand(imgs.shape[0], 1).type(TENSOR) * 0.3
-            fake = Variable(fake, requires_grad=False)
-
-            # Configure input
-            real_imgs = Variable(imgs)
-
-            # -----------------
-            #  Train Generator
-            # -----------------
-
-            optimizer_g.zero_grad()
-
-            # Sample noise as generator input
-            z = Variable(torch.randn(imgs.shape[0], args.latent_dim).type(TENSOR))
-
-            # Generate a batch of images
-            fake_images = generator(z)
-
-            # Loss measures generator's ability to fool the discriminator
-            g_loss = adversarial_loss(discriminator(fake_images), valid)
-
-            g_loss.backward()
-            optimizer_g.step()
-
-            # ---------------------
-            #  Train Discriminator
-            # ---------------------
-
-            optimizer_d.zero_grad()
-
-            # Measure discriminator's ability to classify real from generated samples
-            real_scores = discriminator(real_imgs)
-            real_loss = adversarial_loss(real_scores, valid)
-            fake_scores = discriminator(fake_images.detach())
-            fake_loss = adversarial_loss(fake_scores, fake)
-            d_loss = (real_loss + fake_loss) / 2
-
-            d_loss.backward()
-            optimizer_d.step()
-
-            batches_done = epoch * len(mnist_loader) + i + 1
-            if batches_done % args.sample_interval == 0:
-                LOGGER.log_generated_sample(fake_images, batches_done)
-
-                LOGGER.log_batch_statistics(epoch, args.n_epochs, i + 1, len(mnist_loader), d_loss, g_loss, real_scores,
-                                            fake_scores)
-
-                LOGGER.log_tensorboard_basic_data(g_loss, d_loss, real_scores, fake_scores, batches_done)
-
-                if args.log_details:
-                    if batches_done == args.sample_interval:
-                        LOGGER.save_image_grid(real_imgs, fake_images, batches_done)
-                    else:
-                        LOGGER.save_image_grid(None, fake_images, batches_done)
-        # -- Save model checkpoints after each epoch -- #
-        checkpoint_g.save(RUN, epoch)
-        checkpoint_d.save(RUN, epoch)
-    LOGGER.close_writers()
+    trainer.train(data_loader.load(args, opts))
@@ -1,9 +1,8 @@
 from helpers.initialization import weights_init_xavier
-from helpers.checkpoint import Checkpoint
-from torch.autograd import Variable
-from helpers.logger import Logger
+from helpers.trainer import Trainer, Adversarial
 from helpers import st_heaviside
 from helpers import data_loader
+from torch.autograd import Variable
 from datetime import datetime
 import torch.nn as nn
 import numpy as np
@@ -52,7 +51,7 @@ def run(args):
             )
 
         def forward(self, z_batch):
-            img = st_heaviside.straight_through(self.model(z_batch))
+            img = self.model(z_batch)
             img = img.view(img.size(0), *img_shape)
             return img
 
@@ -74,10 +73,6 @@ def run(args):
             validity = self.model(img_flat)
             return validity
 
-    # Define losses
-    discriminator_loss = torch.nn.BCELoss()
-    generator_loss = boundary_seeking_loss
-
     # Initialize generator and discriminator
     generator = Generator()
     discriminator = Discriminator()
@@ -86,96 +81,23 @@ def run(args):
     optimizer_g = torch.optim.Adam(generator.parameters(), lr=args.g_lr)
     optimizer_d = torch.optim.Adam(discriminator.parameters(), lr=args.d_lr)
 
-    # Map to CUDA if necessary
-    if CUDA:
-        generator.cuda()
-        discriminator.cuda()
-        discriminator_loss.cuda()
-
     # Initialize weights
     generator.apply(weights_init_xavier)
     discriminator.apply(weights_init_xavier)
 
-    # Create checkpoint handler and load state if required
-    current_epoch = 0
-    checkpoint_g = Checkpoint(CWD, generator, optimizer_g)
-    checkpoint_d = Checkpoint(CWD, discriminator, optimizer_d)
-    if args.resume:
-        RUN, current_epoch = checkpoint_g.load()
-        _, _ = checkpoint_d.load()
-        LOGGER = Logger(CWD, RUN, args)
-        print('Loaded models from disk. Starting at epoch {}.'.format(current_epoch + 1))
-    else:
-        LOGGER = Logger(CWD, RUN, args)
+    def sample_noise(n: int) -> Variable:
+        """Sample noise as generator input."""
+        return Variable(TENSOR(np.random.normal(0, 1, (n, args.latent_dim))))
+
+    objective = Adversarial(boundary_seeking_loss)
+    trainer = Trainer(CWD, RUN, args, generator, discriminator, optimizer_g, optimizer_d, objective,
+                      quantizer=st_heaviside.straight_through, noise=sample_noise)
+    LOGGER = trainer.logger
+    RUN = trainer.run
 
     # Configure data loader
     opts = {
         'binary': True,
         'crop': 20
     }
-    mnist_loader = data_loader.load(args, opts)
-
-    for epoch in range(current_epoch, args.n_epochs):
-        for i, imgs in enumerate(mnist_loader):
-
-            # Adversarial ground truths with noise
-            valid = 0.8 + torch.rand(imgs.shape[0], 1).type(TENSOR) * 0.3
-            valid = Variable(valid, requires_grad=False)
-            fake = torch.rand(imgs.shape[0], 1).type(TENSOR) * 0.3
-            fake = Variable(fake, requires_grad=False)
-
-            # Configure input
-            real_imgs = Variable(imgs.type(TENSOR))
-
-            # -----------------
-            #  Train Generator
-            # -----------------
-
-            optimizer_g.zero_grad()
-
-            # Sample noise as generator input
-            z = Variable(TENSOR(np.random.normal(0, 1, (imgs.shape[0], args.latent_dim))))
-
-            # Generate a batch of images
-            fake_images = generator(z)
-
-            # Loss measures generator's ability to fool the discriminator
-            g_loss = generator_loss(discriminator(fake_images))
-
-            g_loss.backward()
-            optimizer_g.step()
-
-            # ---------------------
-            #  Train Discriminator
-            # ---------------------
-
-            optimizer_d.zero_grad()
-
-            # Measure discriminator's ability to classify real from generated samples
-            real_scores = discriminator(real_imgs)
-            real_loss = discriminator_loss(real_scores, valid)
-            fake_scores = discriminator(fake_images.detach())
-            fake_loss = discriminator_loss(fake_scores, fake)
-            d_loss = (real_loss + fake_loss) / 2
-
-            d_loss.backward()
-            optimizer_d.step()
-
-            batches_done = epoch * len(mnist_loader) + i + 1
-            if batches_done % args.sample_interval == 0:
-                LOGGER.log_generated_sample(fake_images, batches_done)
-
-                LOGGER.log_batch_statistics(epoch, args.n_epochs, i + 1, len(mnist_loader), d_loss, g_loss, real_scores,
-                                            fake_scores)
-
-                LOGGER.log_tensorboard_basic_data(g_loss, d_loss, real_scores, fake_scores, batches_done)
-
-                if args.log_details:
-                    if batches_done == args.sample_interval:
-                        LOGGER.save_image_grid(real_imgs, fake_images, batches_done)
-                    else:
-                        LOGGER.save_image_grid(None, fake_images, batches_done)
-        # -- Save model checkpoints after each epoch -- #
-        checkpoint_g.save(RUN, epoch)
-        checkpoint_d.save(RUN, epoch)
-    LOGGER.close_writers()
+    trainer.train(data_loader.load(args, opts))
@@ -1,26 +1,17 @@
-from torchvision.transforms import transforms
-
 from helpers.initialization import weights_init_xavier
-from helpers.checkpoint import Checkpoint
-from torch.autograd import Variable
-from helpers.logger import Logger
-from helpers import data_loader
+from helpers.trainer import Trainer, Adversarial
+from helpers import data_loader, st_heaviside
 from datetime import datetime
 import torch.nn as nn
 import torch
 import os
 import math
-from helpers.st_heaviside import straight_through
-from helpers.maze_utils import check_maze
 
 
 ROOT = os.path.abspath(os.path.join(os.getcwd(), '..'))
 CWD = os.path.dirname(os.path.abspath(__file__))
 RUN = datetime.today().strftime('%Y-%m-%d/%H-%M-%S')
 
-CUDA = True if torch.cuda.is_available() else False
-TENSOR = torch.cuda.FloatTensor if CUDA else torch.FloatTensor
-
 LOGGER = None
 
 
@@ -63,8 +54,7 @@ def run(opt):
             out = self.l1(z)
             out = out.view(out.shape[0], 128, self.init_size)
             fake_mazes = self.model(out)
-    
-            fake_mazes = straight_through(fake_mazes)            
+
             return fake_mazes
 
     class Discriminator(nn.Module):
@@ -98,8 +88,6 @@ def run(opt):
 
             return validity
 
-    adversarial_loss = torch.nn.BCELoss()
-
     # Initialize generator and discriminator
     generator = Generator()
     discriminator = Discriminator()
@@ -108,106 +96,19 @@ def run(opt):
     optimizer_g = torch.optim.Adam(generator.parameters(), lr=opt.g_lr)
     optimizer_d = torch.optim.Adam(discriminator.parameters(), lr=opt.d_lr)
 
-    # Map to CUDA if necessary
-    if CUDA:
-        generator.cuda()
-        discriminator.cuda()
-        adversarial_loss.cuda()
-
     # Initialize weights
     generator.apply(weights_init_xavier)
     discriminator.apply(weights_init_xavier)
 
-    # Create checkpoint handler and load state if required
-    current_epoch = 0
-    checkpoint_g = Checkpoint(CWD, generator, optimizer_g)
-    checkpoint_d = Checkpoint(CWD, discriminator, optimizer_d)
-    if opt.resume:
-        RUN, current_epoch = checkpoint_g.load()
-        _, _ = checkpoint_d.load()
-        LOGGER = Logger(CWD, RUN, opt)
-        print('Loaded models from disk. Starting at epoch {}.'.format(current_epoch + 1))
-    else:
-        LOGGER = Logger(CWD, RUN, opt)
+    objective = Adversarial()
+    trainer = Trainer(CWD, RUN, opt, generator, discriminator, optimizer_g, optimizer_d, objective,
+                      input_shape=(1, -1), quantizer=st_heaviside.straight_through, maze_size=opt.maze_size,
+                      real_grid_once=False)
+    LOGGER = trainer.logger
+    RUN = trainer.run
 
     # Configure data loader
     opts = {
         'binary': True,
     }
-    maze_loader = data_loader.load(opt, opts)
-
-    for epoch in range(current_epoch, opt.n_epochs):
-        for i, mazes in enumerate(maze_loader):
-            mazes= mazes.reshape(opt.batch_size, -1).type(TENSOR).float()
-
-            # Adversarial ground truths
-#            valid = Variable(torch.ones(mazes.shape[0], 1).type(TENSOR), requires_grad=False)
-#            fake = Variable(torch.zeros(mazes.shape[0], 1).type(TENSOR), requires_grad=False)
-            # Adversarial ground truths with noise
-            valid = 0.8 + torch.rand(mazes.shape[0], 1).type(TENSOR) * 0.3
-            valid = Variable(valid, requires_grad=False)
-            fake = torch.rand(mazes.shape[0], 1).type(TENSOR) * 0.3
-            fake = Variable(fake, requires_grad=False)
-
-            # Configure input
-            real_mazes = Variable(mazes)
-            
-            # -----------------
-            #  Train Generator
-            # -----------------
-
-            optimizer_g.zero_grad()
-
-            # Sample noise as generator input
-            z = Variable(torch.randn(mazes.shape[0], opt.latent_dim).type(TENSOR))
-
-            # Generate a batch of images
-            fake_mazes = generator(z)
-
-            # Loss measures generator's ability to fool the discriminator
-            g_loss = adversarial_loss(discriminator(fake_mazes), valid)
-
-            g_loss.backward()
-            optimizer_g.step()
-
-            # ---------------------
-            #  Train Discriminator
-            # ---------------------
-
-            optimizer_d.zero_grad()
-
-            # Measure discriminator's ability to classify real from generated samples
-            real_mazes = real_mazes.unsqueeze_(1)
-            real_scores = discriminator(real_mazes)
-            real_loss = adversarial_loss(real_scores, valid)
-            fake_scores = discriminator(fake_mazes.detach())
-            fake_loss = adversarial_loss(fake_scores, fake)
-            d_loss = (real_loss + fake_loss) / 2
-
-            d_loss.backward()
-            optimizer_d.step()
-
-            batches_done = epoch * len(maze_loader) + i + 1
-            if batches_done % opt.sample_interval == 0:
-                fake_mazes = fake_mazes.reshape(fake_mazes.size(0), opt.maze_size, opt.maze_size)
-                fake_mazes[fake_mazes < 0.5] = 0
-                fake_mazes[fake_mazes > 0.5] = 1
-                #correct = 0
-                #for maze in fake_mazes:
-                #    correct += int(check_maze(maze.detach()))
-                #print(correct)
-                real_mazes = real_mazes.reshape(real_mazes.size(0), opt.maze_size, opt.maze_size)
-                LOGGER.log_generated_sample(fake_mazes, batches_done)
-
-                LOGGER.log_batch_statistics(epoch, opt.n_epochs, i + 1, len(maze_loader), d_loss, g_loss, real_scores,
-                                            fake_scores)
-
-                LOGGER.log_tensorboard_basic_data(g_loss, d_loss, real_scores, fake_scores, batches_done)
-
-                if opt.log_details:
-                    LOGGER.save_image_grid(real_mazes, fake_mazes, batches_done)
-                    # LOGGER.log_tensorboard_parameter_data(discriminator, generator, batches_done)
-        # -- Save model checkpoints after each epoch -- #
-        checkpoint_g.save(RUN, epoch)
-        checkpoint_d.save(RUN, epoch)
-    LOGGER.close_writers()
+    trainer.train(data_loader.load(opt, opts))
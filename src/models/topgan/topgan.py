@@ -1,9 +1,7 @@
 from argparse import Namespace
 
 from helpers.initialization import weights_init_xavier
-from helpers.checkpoint import Checkpoint
-from torch.autograd import Variable
-from helpers.logger import Logger
+from helpers.trainer import Trainer, Wasserstein
 from helpers import data_loader, st_gumbel_softmax, maze_utils
 from datetime import datetime
 import torch.nn as nn
@@ -16,9 +14,6 @@ ROOT = os.path.abspath(os.path.join(os.getcwd(), '..'))
 CWD = os.path.dirname(os.path.abspath(__file__))
 RUN = datetime.today().strftime('%Y-%m-%d/%H-%M-%S')
 
-CUDA = True if torch.cuda.is_available() else False
-TENSOR = torch.cuda.FloatTensor if CUDA else torch.FloatTensor
-
 LOGGER = None
 
 
@@ -56,18 +51,12 @@ def run(args: Namespace):
                 nn.Conv1d(64, 1, 3, stride=1, padding=1),
             )
 
-            self.out = nn.LogSigmoid()
-
         def forward(self, z):
             map1 = self.l1(z)
             map1 = map1.view(map1.size(0), 128, self.init_size)
             conv = self.model(map1).view(args.batch_size, args.img_size ** 2, 1)
 
-            white_prob = self.out(conv).view(args.batch_size, args.img_size ** 2, 1)
-            black_prob = self.out(-conv).view(args.batch_size, args.img_size ** 2, 1)
-
-            probs = torch.cat([black_prob, white_prob], dim=-1)
-            img = st_gumbel_softmax.straight_through(probs, args.temp, True)
+            img = st_gumbel_softmax.binary_straight_through(conv, args.temp)
 
             return img.view(args.batch_size, 1, args.img_size ** 2)
 
@@ -109,95 +98,18 @@ def run(args: Namespace):
     optimizer_g = torch.optim.RMSprop(generator.parameters(), lr=args.g_lr)
     optimizer_d = torch.optim.RMSprop(discriminator.parameters(), lr=args.d_lr)
 
-    # Map to CUDA if necessary
-    if CUDA:
-        generator.cuda()
-        discriminator.cuda()
-
     # Initialize weights
     generator.apply(weights_init_xavier)
     discriminator.apply(weights_init_xavier)
 
-    # Create checkpoint handler and load state if required
-    current_epoch = 0
-    checkpoint_g = Checkpoint(CWD, generator, optimizer_g)
-    checkpoint_d = Checkpoint(CWD, discriminator, optimizer_d)
-    if args.resume:
-        RUN, current_epoch = checkpoint_g.load()
-        _, _ = checkpoint_d.load()
-        LOGGER = Logger(CWD, RUN, args)
-        print('Loaded models from disk. Starting at epoch {}.'.format(current_epoch + 1))
-    else:
-        LOGGER = Logger(CWD, RUN, args)
+    objective = Wasserstein(args.n_critic, args.clip_value)
+    trainer = Trainer(CWD, RUN, args, generator, discriminator, optimizer_g, optimizer_d, objective,
+                      input_shape=(1, -1), maze_size=args.img_size)
+    LOGGER = trainer.logger
+    RUN = trainer.run
 
     # Configure data loader
     opts = {
         'binary': True,
     }
-    batched_data = data_loader.load(args, opts)
-
-    for epoch in range(current_epoch, args.n_epochs):
-        for i, mazes in enumerate(batched_data):
-            batches_done = epoch * len(batched_data) + i + 1
-
-            mazes = mazes.reshape(args.batch_size, 1, -1).type(TENSOR)
-
-            # Configure input
-            real_images = Variable(mazes)
-
-            # ---------------------
-            #  Train Discriminator
-            # ---------------------
-
-            optimizer_d.zero_grad()
-
-            z = Variable(torch.randn(real_images.size(0), args.latent_dim).type(TENSOR))
-            fake_images = generator(z).detach()
-            # Adversarial loss
-            loss_d = -torch.mean(discriminator(real_images)) + torch.mean(discriminator(fake_images))
-
-            loss_d.backward()
-            optimizer_d.step()
-
-            # Clip weights of discriminator
-            for p in discriminator.parameters():
-                p.data.clamp_(-args.clip_value, args.clip_value)
-
-            # Train the generator every n_critic iterations
-            if batches_done % args.n_critic == 0:
-                # -----------------
-                #  Train Generator
-                # -----------------
-
-                optimizer_g.zero_grad()
-
-                # Generate a batch of images
-                fake_images = generator(z)
-                # Adversarial loss
-                loss_g = -torch.mean(discriminator(fake_images))
-
-                loss_g.backward()
-                optimizer_g.step()
-
-                if batches_done % args.sample_interval == 0:
-                    fake_mazes = fake_images.reshape(fake_images.size(0), args.img_size, args.img_size)
-                    fake_mazes[fake_mazes < 0.5] = 0
-                    fake_mazes[fake_mazes > 0.5] = 1
-                    real_mazes = real_images.reshape(real_images.size(0), args.img_size, args.img_size)
-
-                    LOGGER.log_generated_sample(fake_mazes, batches_done)
-
-                    LOGGER.log_batch_statistics(epoch, args.n_epochs, i + 1, len(batched_data), loss_d, loss_g)
-
-                    LOGGER.log_tensorboard_basic_data(loss_g, loss_d, step=batches_done)
-
-                    if args.log_details:
-                        if batches_done == args.sample_interval:
-                            LOGGER.save_image_grid(real_mazes, fake_mazes, batches_done)
-                        else:
-                            LOGGER.save_image_grid(None, fake_images, batches_done)
-
-        # -- Save model checkpoints after each epoch -- #
-        checkpoint_g.save(RUN, epoch)
-        checkpoint_d.save(RUN, epoch)
-    LOGGER.close_writers()
+    trainer.train(data_loader.load(args, opts))
@@ -7,16 +7,42 @@ if __name__ == '__main__':
 
     # -- MODEL OPTIONS -- #
     parser.add_argument('-m', '--model', type=str, help='the model to use. should reference folder and python file')
-    parser.add_argument('-d', '--dataset', type=str, help='the data set to use. possible values: mnist, mazes')
+    parser.add_argument('-d', '--dataset', type=str,
+                        help='the data set to use. possible values: mnist, mazes, mazes_stream')
+    parser.add_argument('--stream_workers', type=int, default=1,
+                        help='number of processes generating mazes for the mazes_stream data set')
+    parser.add_argument('--holdout', type=str, default=None,
+                        help='a maze data set file whose mazes the mazes_stream data set never produces')
     parser.add_argument('-r', '--resume', type=bool, help='whether to resume training')
 
     # -- LOGGING OPTIONS -- #
     parser.add_argument('-l', '--log_details', type=bool, default=False,
                         help='whether to log parameter, gradient data and epochs')
 
+    parser.add_argument('--async_logging', action='store_true',
+                        help='write logs, samples and images on a background thread instead of in the training loop')
+    parser.add_argument('--render_process', action='store_true',
+                        help='render the image grids of --log_details in a separate process')
+    parser.add_argument('--pack_samples', action='store_true',
+                        help='store generated samples as bits, only for binary samples such as mazes')
+    parser.add_argument('--sample_store', action='store_true',
+                        help='append generated samples as bits to a single store per run instead of a file per sample,'
+                             ' only for binary samples such as mazes')
+
+    parser.add_argument('--compile', action='store_true',
+                        help='compile the generator, discriminator, quantizer and losses into fused graphs, '
+                             'needs torch 2.0 or later')
+
     # -- HYPER PARAMS -- #
     parser.add_argument('--n_epochs', type=int, default=200, help='number of epochs of training')
     parser.add_argument('--n_examples', type=int, default=60000, help='training examples to load (used only for mazes)')
+    parser.add_argument('--no_shuffle', action='store_true', help='iterate the batches in the same order every epoch')
+    parser.add_argument('--last_batch', type=str, default='drop', choices=['drop', 'pad'],
+                        help='drop the examples that do not fill a last batch, or pad it with examples from the start')
+    parser.add_argument('--mmap', action='store_true',
+                        help='memory map the packed maze data set instead of loading it, packing it first if needed')
+    parser.add_argument('--prefetch', type=int, default=0,
+                        help='number of batches to prepare on a background thread, 0 to prepare them when needed')
     parser.add_argument('--batch_size', type=int, default=60, help='size of the batches')
     parser.add_argument('--d_lr', type=float, default=0.0002, help='adam: learning rate for discriminator')
     parser.add_argument('--g_lr', type=float, default=0.0002, help='adam: learning rate for generator')